@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------------------------------
+# Copyright (c) 2013-2025, Ryan Galloway (ryan@rsgalloway.com)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# - Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# - Neither the name of the software nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# ---------------------------------------------------------------------------------------------
+# docs and latest version available for download at
+# http://github.com/rsgalloway/instapaper
+# ---------
+
+"""
+Benchmarks for the instapaper module.
+
+    $ python bench_instapaper.py dehtml
+    $ python bench_instapaper.py --save baseline.json
+    $ python bench_instapaper.py --compare baseline.json
+
+The dehtml benchmark converts the article html fixtures in fixtures/articles
+with every available backend and reports the speedup over the reference
+HTMLParser implementation. The list, get_text and mutate benchmarks run the
+client against a local MockInstapaper server, and parse times decoding of
+a bookmarks/list response. The import benchmark measures the cold start
+cost of importing the module in a fresh interpreter.
+
+--save records each benchmark's metrics to a json file, and --compare
+exits non-zero when a throughput (*_per_sec) metric drops, or a time (*_ms)
+or memory (*_kb) metric grows, by more than --tolerance against it.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import instapaper
+from mock_instapaper import MockInstapaper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_articles():
+    """
+    Returns a list of (name, html) for the article fixtures.
+    """
+    articles = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "articles", "*.html"))):
+        with open(path) as f:
+            articles.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    return articles
+
+
+def best_of(func, repeat=5, number=None):
+    """
+    Returns the best time in seconds of a single call to func.
+    """
+    if number is None:
+        number, elapsed = timeit.Timer(func).autorange()
+    times = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    return min(times) / number
+
+
+def bench_dehtml(repeat=5):
+    """
+    Times each dehtml backend on each fixture. Returns a dict of
+    backend -> {fixture: seconds}.
+    """
+    articles = load_articles()
+    backends = ["htmlparser", "regex"]
+    if instapaper._lxml_available():
+        backends.append("lxml")
+    results = {}
+    for backend in backends:
+        func = instapaper.DEHTML_BACKENDS[backend]
+        results[backend] = dict(
+            (name, best_of(lambda: func(html), repeat)) for name, html in articles
+        )
+    return results
+
+
+def report_dehtml(results):
+    names = sorted(results["htmlparser"])
+    baseline = sum(results["htmlparser"].values())
+    print(
+        "{:<12}".format("dehtml")
+        + "".join("{:>12}".format(n) for n in names)
+        + "{:>10}".format("speedup")
+    )
+    for backend, times in results.items():
+        print(
+            "{:<12}".format(backend)
+            + "".join("{:>10.2f}ms".format(times[n] * 1000) for n in names)
+            + "{:>9.1f}x".format(baseline / sum(times.values()))
+        )
+
+
+def summary_dehtml(results):
+    return dict(
+        (backend + "_ms", sum(times.values()) * 1000)
+        for backend, times in results.items()
+    )
+
+
+def peak_kb(func):
+    """
+    Returns the peak memory allocated while calling func, in KB.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+
+def client_for(server, **kwargs):
+    """
+    Returns an Instapaper client logged in to a MockInstapaper server.
+    """
+    limiter = instapaper.RateLimiter(backoff=0.001)
+    client = instapaper.Instapaper(
+        server.consumer_key,
+        server.consumer_secret,
+        base=server.base,
+        limiter=limiter,
+        **kwargs
+    )
+    username, password = sorted(server.users.items())[0]
+    client.login(username, password)
+    return client
+
+
+def bench_list(repeat=5, bookmarks=5000, page_size=500):
+    """
+    Walks a whole folder with iter_bookmarks.
+    """
+    with MockInstapaper(bookmarks=bookmarks) as server:
+        client = client_for(server)
+
+        def walk():
+            return sum(1 for _ in client.iter_bookmarks(page_size=page_size))
+
+        elapsed = best_of(walk, repeat, 1)
+        pages = bookmarks // page_size + 1
+        return {
+            "bookmarks_per_sec": bookmarks / elapsed,
+            "requests_per_sec": pages / elapsed,
+            "peak_kb": peak_kb(walk),
+        }
+
+
+def bench_get_text(repeat=5, count=200, workers=8, latency=0.002):
+    """
+    Fetches article text concurrently with fetch_texts.
+    """
+    with MockInstapaper(bookmarks=count, latency=latency) as server:
+        client = client_for(server, pool_size=workers)
+        records = [mark.to_dict() for mark in client.bookmarks(limit=count)]
+
+        def fetch():
+            marks = [instapaper.Bookmark(client, record) for record in records]
+            for mark in client.fetch_texts(marks, workers):
+                pass
+
+        elapsed = best_of(fetch, repeat, 1)
+        return {"texts_per_sec": count / elapsed, "peak_kb": peak_kb(fetch)}
+
+
+def bench_mutate(repeat=5, count=500, workers=8, latency=0.002):
+    """
+    Stars and unstars bookmarks through a Batch.
+    """
+    with MockInstapaper(bookmarks=count, latency=latency) as server:
+        client = client_for(server, pool_size=workers)
+        marks = client.bookmarks(limit=count)
+        state = {"star": True}
+
+        def mutate():
+            with client.batch(workers) as batch:
+                for mark in marks:
+                    mark.star() if state["star"] else mark.unstar()
+            state["star"] = not state["star"]
+            assert all(r.result for r in batch.results)
+
+        elapsed = best_of(mutate, repeat, 1)
+        return {"ops_per_sec": count / elapsed}
+
+
+def bench_parse(repeat=5, count=500):
+    """
+    Decodes a bookmarks/list response into Bookmark objects.
+    """
+    with MockInstapaper(bookmarks=count) as server:
+        account = server.account("user")
+        data = json.dumps(server._list(account, {"limit": str(count)})).encode()
+
+    def parse():
+        return [
+            instapaper.Bookmark(None, record)
+            for record in instapaper._records(data, "bookmarks")
+        ]
+
+    elapsed = best_of(parse, repeat)
+    return {
+        "bookmarks_per_sec": count / elapsed,
+        "json_loads_ms": best_of(lambda: json.loads(data), repeat) * 1000,
+        "parse_ms": elapsed * 1000,
+        "peak_kb": peak_kb(parse),
+    }
+
+
+def bench_import(repeat=5):
+    """
+    Imports instapaper in a fresh interpreter with -X importtime.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-X", "importtime", "-c", "import instapaper"],
+            cwd=here,
+            stderr=subprocess.STDOUT,
+        )
+        for line in output.decode("utf-8").splitlines():
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == "instapaper":
+                times.append(int(fields[1]) / 1000.0)
+    return {"import_ms": min(times)}
+
+
+def report_metrics(results):
+    for metric, value in sorted(results.items()):
+        print("{:<24}{:>14.1f}".format(metric, value))
+
+
+BENCHMARKS = {
+    "dehtml": (bench_dehtml, report_dehtml, summary_dehtml),
+    "list": (bench_list, report_metrics, dict),
+    "get_text": (bench_get_text, report_metrics, dict),
+    "mutate": (bench_mutate, report_metrics, dict),
+    "parse": (bench_parse, report_metrics, dict),
+    "import": (bench_import, report_metrics, dict),
+}
+
+
+def regressions(baseline, results, tolerance):
+    """
+    Returns a list of (benchmark, metric, baseline, result) for metrics
+    that got worse than baseline by more than tolerance.
+    """
+    worse = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get(name, {}).get(metric)
+            if not before:
+                continue
+            if metric.endswith("_per_sec"):
+                regressed = value < before * (1 - tolerance)
+            else:
+                regressed = value > before * (1 + tolerance)
+            if regressed:
+                worse.append((name, metric, before, value))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*", default=sorted(BENCHMARKS))
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results to a json file")
+    parser.add_argument("--compare", help="compare results to a saved json file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    results = {}
+    for name in args.benchmarks:
+        run, report, summary = BENCHMARKS[name]
+        start = time.time()
+        result = run(repeat=args.repeat)
+        report(result)
+        results[name] = summary(result)
+        print("({} took {:.1f}s)\n".format(name, time.time() - start))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            worse = regressions(json.load(f), results, args.tolerance)
+        for name, metric, before, value in worse:
+            print(
+                "REGRESSION {} {}: {:.1f} -> {:.1f}".format(name, metric, before, value)
+            )
+        if worse:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -43,21 +43,65 @@ __author__ = "Ryan Galloway <ryan@rsgalloway.com>"
 import os
 import sys
 
+import importlib
+
+
+class _LazyModule(object):
+    """
+    Stands in for a module until one of its attributes is first used, so
+    importing instapaper does not pay for modules a caller never needs.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self.__name), attr)
+        setattr(self, attr, value)
+        return value
+
+
 if sys.version_info > (3, 0):
+    import http.client as httplib
+    import queue
     import urllib.parse as urlparse
+    from html import unescape
     from html.parser import HTMLParser
-    from urllib.parse import urlencode
+    from urllib.parse import quote, urlencode
 else:
+    import httplib
+    import Queue as queue
     import urlparse
-    from urllib import urlencode
+    from urllib import quote, urlencode
     from HTMLParser import HTMLParser
 
-import json
+    unescape = HTMLParser().unescape
+
+import base64
+import io
+import hashlib
+import hmac
+import mmap
+import struct
+import random
+import socket
+import ssl
+import time
+import threading
+import zlib
+from collections import OrderedDict, deque, namedtuple
+import re
 from re import sub
-from sys import stderr
-from traceback import print_exc
 
-import oauth2 as oauth
+# deferred until first use, see _LazyModule
+argparse = _LazyModule("argparse")
+csv = _LazyModule("csv")
+json = _LazyModule("json")
+netrc = _LazyModule("netrc")
+sqlite3 = _LazyModule("sqlite3")
+multiprocessing = _LazyModule("multiprocessing")
+multiprocessing_pool = _LazyModule("multiprocessing.pool")
+oauth = _LazyModule("oauth2")
 
 _BASE_ = "https://www.instapaper.com"
 _API_VERSION_ = os.getenv("API_VERSION", "api/1.1")
@@ -72,10 +116,634 @@ _BOOKMARKS_UNARCHIVE_ = "bookmarks/unarchive"
 _BOOKMARKS_ADD_ = "bookmarks/add"
 _BOOKMARKS_DELETE_ = "bookmarks/delete"
 _BOOKMARKS_MOVE_ = "bookmarks/move"
+_BOOKMARKS_UPDATE_READ_PROGRESS_ = "bookmarks/update_read_progress"
 _FOLDERS_ADD_ = "folders/add"
 _FOLDERS_LIST_ = "folders/list"
 _FOLDERS_DELETE = "folders/delete"
 _HIGHLIGHTS_ = "highlights"
+_ENDPOINTS_ = (
+    _ACCESS_TOKEN_,
+    _ACCOUNT_,
+    _BOOKMARKS_LIST_,
+    _BOOKMARKS_TEXT_,
+    _BOOKMARKS_STAR_,
+    _BOOKMARKS_UNSTAR_,
+    _BOOKMARKS_ARCHIVE_,
+    _BOOKMARKS_UNARCHIVE_,
+    _BOOKMARKS_ADD_,
+    _BOOKMARKS_DELETE_,
+    _BOOKMARKS_MOVE_,
+    _BOOKMARKS_UPDATE_READ_PROGRESS_,
+    _FOLDERS_ADD_,
+    _FOLDERS_LIST_,
+    _FOLDERS_DELETE,
+    _HIGHLIGHTS_,
+)
+_URLS = {}
+
+
+def _api_urls(base):
+    """
+    Returns a dict of endpoint -> full url under base, built once per base.
+    """
+    urls = _URLS.get(base)
+    if urls is None:
+        api = "/".join([base, _API_VERSION_])
+        urls = _URLS[base] = dict((e, "/".join([api, e])) for e in _ENDPOINTS_)
+    return urls
+
+
+def _quote(value):
+    """
+    Percent-encodes a value as required by OAuth 1.0a (RFC 3986).
+    """
+    if not isinstance(value, str):
+        value = value.encode("utf-8") if sys.version_info < (3, 0) else str(value)
+    return quote(value, safe="~")
+
+
+class _Response(dict):
+    """
+    httplib2-style response: lowercase headers plus "status", with the
+    numeric status code available as `.status`.
+    """
+
+    def __init__(self, status, headers=()):
+        dict.__init__(self, ((k.lower(), v) for k, v in headers))
+        self.status = int(status)
+        self["status"] = str(self.status)
+
+
+class OAuthSigner(object):
+    """
+    Signs requests with OAuth 1.0a HMAC-SHA1. The signing key is derived
+    once from the consumer/token secrets and reused for every request.
+
+    consumer_key, consumer_secret: Required. Application credentials.
+    token, token_secret: Optional. User access token.
+    """
+
+    def __init__(self, consumer_key, consumer_secret, token=None, token_secret=None):
+        self.consumer_key = consumer_key
+        self.token = token
+        self.key = "{}&{}".format(
+            _quote(consumer_secret), _quote(token_secret or "")
+        ).encode("utf-8")
+
+    def authorization(self, method, uri, params=None, nonce=None, timestamp=None):
+        """
+        Returns the Authorization header value for a request, where params
+        are the decoded form body parameters.
+        """
+        oauth_params = {
+            "oauth_consumer_key": self.consumer_key,
+            "oauth_nonce": nonce or str(random.getrandbits(64)),
+            "oauth_signature_method": "HMAC-SHA1",
+            "oauth_timestamp": str(timestamp or int(time.time())),
+            "oauth_version": "1.0",
+        }
+        if self.token:
+            oauth_params["oauth_token"] = self.token
+        parts = urlparse.urlsplit(uri)
+        netloc = parts.netloc.lower()
+        if (parts.scheme, parts.port) in (("http", 80), ("https", 443)):
+            netloc = netloc.rsplit(":", 1)[0]
+        pairs = urlparse.parse_qsl(parts.query, keep_blank_values=True)
+        pairs.extend((params or {}).items())
+        pairs.extend(oauth_params.items())
+        normalized = "&".join(
+            "{}={}".format(k, v)
+            for k, v in sorted((_quote(k), _quote(v)) for k, v in pairs)
+        )
+        base = "&".join(
+            [
+                method.upper(),
+                _quote("{}://{}{}".format(parts.scheme, netloc, parts.path)),
+                _quote(normalized),
+            ]
+        )
+        digest = hmac.new(self.key, base.encode("utf-8"), hashlib.sha1).digest()
+        oauth_params["oauth_signature"] = base64.b64encode(digest).decode("ascii")
+        return 'OAuth realm="", ' + ", ".join(
+            '{}="{}"'.format(k, _quote(v)) for k, v in sorted(oauth_params.items())
+        )
+
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    """
+    HTTPS connection that resumes the pool's last TLS session.
+    """
+
+    def __init__(self, pool, host, port, timeout):
+        httplib.HTTPSConnection.__init__(
+            self, host, port, timeout=timeout, context=pool.ssl_context
+        )
+        self.pool = pool
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        kwargs = {"server_hostname": self.host}
+        if self.pool.tls_session is not None:
+            kwargs["session"] = self.pool.tls_session
+        self.sock = self.pool.ssl_context.wrap_socket(sock, **kwargs)
+
+
+# raised on a reused keep-alive connection that the server closed while it
+# sat idle; the request was not processed, so it is safe to send again
+try:
+    _STALE_CONNECTION = (
+        httplib.RemoteDisconnected,
+        BrokenPipeError,
+        ConnectionResetError,
+    )
+except (AttributeError, NameError):
+    _STALE_CONNECTION = (httplib.BadStatusLine,)
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of keep-alive connections to a single host. TLS
+    sessions are reused across connections to skip full handshakes.
+
+    base: Optional. Base url, default https://www.instapaper.com
+    size: Optional. Maximum number of open connections, default 10.
+    timeout: Optional. Socket timeout in seconds.
+    """
+
+    def __init__(self, base=_BASE_, size=10, timeout=30):
+        parts = urlparse.urlsplit(base)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == "https" else 80)
+        self.size = size
+        self.timeout = timeout
+        self.ssl_context = (
+            ssl.create_default_context() if self.scheme == "https" else None
+        )
+        self.tls_session = None
+        self.__idle = queue.LifoQueue()
+        self.__slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        if self.scheme == "https":
+            return _HTTPSConnection(self, self.host, self.port, self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Sends a request on a pooled connection, returning (response, content).
+        """
+        with self.__slots:
+            try:
+                conn, reused = self.__idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            try:
+                return self._send(conn, method, path, body, headers)
+            except _STALE_CONNECTION:
+                conn.close()
+                if not reused:
+                    raise
+                # idle connection was closed by the server, retry on a new one
+            except BaseException:
+                conn.close()
+                raise
+            conn = self._connect()
+            try:
+                return self._send(conn, method, path, body, headers)
+            except BaseException:
+                conn.close()
+                raise
+
+    def _send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers or {})
+        resp = conn.getresponse()
+        content = resp.read()
+        if getattr(conn.sock, "session", None) is not None:
+            self.tls_session = conn.sock.session
+        if resp.will_close:
+            conn.close()
+        else:
+            self.__idle.put(conn)
+        return _Response(resp.status, resp.getheaders()), content
+
+    def close(self):
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_clock = getattr(time, "monotonic", time.time)
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second up to `burst`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.limit = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = _clock()
+        self.__lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, returning how many seconds the caller must wait for it.
+        """
+        with self.__lock:
+            now = _clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter(object):
+    """
+    Client-side scheduler for the request path: a token bucket per endpoint
+    group (bookmarks, highlights, folders, ...) plus adaptive backoff with
+    jitter when the server answers 429 or 503. Throttling halves a group's
+    rate, which then recovers gradually on success.
+
+    rates: Optional. Dict of group -> requests per second, or a tuple of
+           (rate, burst). Groups without a rate are not limited.
+    max_retries: Optional. Retries of a throttled request, default 5.
+    backoff: Optional. Base backoff delay in seconds, default 1.
+    max_backoff: Optional. Upper bound on a single backoff delay.
+    """
+
+    THROTTLED = (429, 503)
+
+    def __init__(self, rates=None, max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        for group, rate in (rates or {}).items():
+            if not isinstance(rate, tuple):
+                rate = (rate,)
+            self.buckets[group] = TokenBucket(*rate)
+        self.__lock = threading.Lock()
+        self.__blocked = {}
+        self.__stats = {}
+
+    @staticmethod
+    def group(uri):
+        """
+        Returns the endpoint group of a request url.
+        """
+        path = urlparse.urlsplit(uri).path
+        if _API_VERSION_ in path:
+            path = path.split(_API_VERSION_, 1)[1]
+        parts = path.strip("/").split("/")
+        if "highlights" in parts or "highlight" in parts:
+            return "highlights"
+        return parts[0]
+
+    def _stats(self, group):
+        return self.__stats.setdefault(
+            group,
+            {
+                "queue_depth": 0,
+                "requests": 0,
+                "throttled": 0,
+                "wait_time": 0.0,
+                "max_wait": 0.0,
+            },
+        )
+
+    def acquire(self, group):
+        """
+        Blocks until a request in the group may be sent.
+        """
+        bucket = self.buckets.get(group)
+        with self.__lock:
+            stats = self._stats(group)
+            stats["queue_depth"] += 1
+            blocked = self.__blocked.get(group, 0) - _clock()
+        wait = max(bucket.reserve() if bucket else 0.0, blocked)
+        if wait > 0:
+            time.sleep(wait)
+        with self.__lock:
+            stats["queue_depth"] -= 1
+            stats["requests"] += 1
+            stats["wait_time"] += max(wait, 0.0)
+            stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def throttled(self, group, attempt, retry_after=None):
+        """
+        Records a 429/503 response and blocks the group for an exponential,
+        jittered delay (at least Retry-After). Returns the delay.
+        """
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        delay *= random.uniform(0.5, 1.0)
+        try:
+            delay = max(delay, float(retry_after or 0))
+        except ValueError:
+            pass
+        bucket = self.buckets.get(group)
+        with self.__lock:
+            self._stats(group)["throttled"] += 1
+            now = _clock()
+            blocked = self.__blocked.get(group, 0)
+            # slow down once per backoff window, not once per failed request
+            if bucket is not None and blocked <= now:
+                bucket.rate = max(bucket.limit / 16, bucket.rate / 2)
+            self.__blocked[group] = max(blocked, now + delay)
+        return delay
+
+    def succeeded(self, group):
+        bucket = self.buckets.get(group)
+        if bucket is not None and bucket.rate < bucket.limit:
+            bucket.rate = min(bucket.limit, bucket.rate + bucket.limit / 10)
+
+    def stats(self):
+        """
+        Returns a dict of group -> queue_depth, requests, throttled,
+        wait_time and max_wait.
+        """
+        with self.__lock:
+            return dict((k, dict(v)) for k, v in self.__stats.items())
+
+
+TraceEvent = namedtuple(
+    "TraceEvent", "method endpoint status elapsed bytes_sent bytes_received attempt"
+)
+
+
+class Metrics(object):
+    """
+    In-process registry of request metrics per endpoint: counts by status,
+    a latency histogram, bytes sent and received and throttling retries.
+    Endpoints are api paths with ids replaced, e.g. bookmarks/:id/highlights.
+
+    buckets: Optional. Upper bounds of the latency histogram in seconds.
+    trace: Optional. Callable taking a TraceEvent, called after every
+           request attempt.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None, trace=None):
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        self.trace = trace
+        self.__lock = threading.Lock()
+        self.__endpoints = {}
+
+    @staticmethod
+    def endpoint(uri):
+        """
+        Returns the endpoint name of a request url.
+        """
+        path = urlparse.urlsplit(uri).path
+        if _API_VERSION_ in path:
+            path = path.split(_API_VERSION_, 1)[1]
+        return "/".join(
+            ":id" if part.isdigit() else part for part in path.strip("/").split("/")
+        )
+
+    def _endpoint(self, name):
+        return self.__endpoints.setdefault(
+            name,
+            {
+                "statuses": {},
+                "buckets": [0] * (len(self.buckets) + 1),
+                "latency": 0.0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "retries": 0,
+            },
+        )
+
+    def record(self, method, uri, status, elapsed, sent=0, received=0, attempt=0):
+        """
+        Records one request attempt. status is the http status, or "error"
+        when no response was received.
+        """
+        name = self.endpoint(uri)
+        i = 0
+        while i < len(self.buckets) and elapsed > self.buckets[i]:
+            i += 1
+        with self.__lock:
+            stats = self._endpoint(name)
+            statuses = stats["statuses"]
+            statuses[status] = statuses.get(status, 0) + 1
+            stats["buckets"][i] += 1
+            stats["latency"] += elapsed
+            stats["bytes_sent"] += sent
+            stats["bytes_received"] += received
+            if attempt:
+                stats["retries"] += 1
+        if self.trace is not None:
+            self.trace(
+                TraceEvent(method, name, status, elapsed, sent, received, attempt)
+            )
+
+    def stats(self):
+        """
+        Returns a dict of endpoint -> requests, statuses, latency (total
+        seconds), buckets (per-bucket counts, the last one unbounded),
+        bytes_sent, bytes_received and retries.
+        """
+        with self.__lock:
+            result = {}
+            for name, stats in self.__endpoints.items():
+                stats = dict(stats, statuses=dict(stats["statuses"]))
+                stats["buckets"] = list(stats["buckets"])
+                stats["requests"] = sum(stats["statuses"].values())
+                result[name] = stats
+            return result
+
+    def reset(self):
+        with self.__lock:
+            self.__endpoints.clear()
+
+    def prometheus(self, prefix="instapaper"):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        stats = self.stats()
+        lines = []
+
+        def header(name, kind, help):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+
+        def sample(name, labels, value):
+            labels = ",".join('{}="{}"'.format(k, v) for k, v in labels)
+            lines.append("{}_{}{{{}}} {}".format(prefix, name, labels, value))
+
+        header("requests_total", "counter", "Requests sent, by endpoint and status.")
+        for name in sorted(stats):
+            for status, count in sorted(stats[name]["statuses"].items(), key=str):
+                sample(
+                    "requests_total", [("endpoint", name), ("status", status)], count
+                )
+        header("request_duration_seconds", "histogram", "Request latency.")
+        for name in sorted(stats):
+            count = 0
+            bounds = ["{:g}".format(b) for b in self.buckets] + ["+Inf"]
+            for bound, n in zip(bounds, stats[name]["buckets"]):
+                count += n
+                sample(
+                    "request_duration_seconds_bucket",
+                    [("endpoint", name), ("le", bound)],
+                    count,
+                )
+            sample(
+                "request_duration_seconds_sum",
+                [("endpoint", name)],
+                "{:.6f}".format(stats[name]["latency"]),
+            )
+            sample("request_duration_seconds_count", [("endpoint", name)], count)
+        header("bytes_total", "counter", "Bytes transferred, by direction.")
+        for name in sorted(stats):
+            for direction in ("sent", "received"):
+                sample(
+                    "bytes_total",
+                    [("endpoint", name), ("direction", direction)],
+                    stats[name]["bytes_" + direction],
+                )
+        header("retries_total", "counter", "Requests retried after throttling.")
+        for name in sorted(stats):
+            sample("retries_total", [("endpoint", name)], stats[name]["retries"])
+        return "\n".join(lines) + "\n"
+
+
+class SingleFlight(object):
+    """
+    Merges concurrent identical calls: while one thread runs a call for a
+    key, other threads asking for the same key wait for it and share its
+    result or exception instead of making the call again.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def __len__(self):
+        return len(self.__calls)
+
+    def do(self, key, func):
+        """
+        Returns func(), or the result of the call already running for key.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = func()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call[0].set()
+        return call[1]
+
+
+class HTTPTransport(object):
+    """
+    Default transport behind Instapaper.http: signs each request with a
+    precomputed OAuthSigner and sends it over a shared ConnectionPool.
+    Safe to use from many threads. Any object with the same request()
+    signature (e.g. an oauth.Client) can be used in its place.
+
+    Identical read requests (see READS) made concurrently are sent once
+    and the response is shared, see SingleFlight.
+
+    signer: Required. OAuthSigner for the consumer/token pair.
+    pool: Required. ConnectionPool to send requests on.
+    limiter: Optional. RateLimiter applied to every request.
+    metrics: Optional. Metrics every request attempt is recorded in.
+    singleflight: Optional. Merge concurrent identical reads, default True.
+    """
+
+    READS = frozenset(
+        [
+            _ACCOUNT_,
+            _BOOKMARKS_LIST_,
+            _BOOKMARKS_TEXT_,
+            _FOLDERS_LIST_,
+            "bookmarks/:id/highlights",
+        ]
+    )
+
+    def __init__(self, signer, pool, limiter=None, metrics=None, singleflight=True):
+        self.signer = signer
+        self.pool = pool
+        self.limiter = limiter or RateLimiter()
+        self.metrics = metrics
+        self.inflight = SingleFlight() if singleflight else None
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        if self.inflight is not None and Metrics.endpoint(uri) in self.READS:
+            return self.inflight.do(
+                (method, uri, body),
+                lambda: self._request(uri, method, body, headers),
+            )
+        return self._request(uri, method, body, headers)
+
+    def _request(self, uri, method, body, headers):
+        params = dict(urlparse.parse_qsl(body or "", keep_blank_values=True))
+        headers = dict(headers or {})
+        if body is not None:
+            headers.setdefault("Content-Type", "application/x-www-form-urlencoded")
+            body = body.encode("utf-8")
+        parts = urlparse.urlsplit(uri)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        group = self.limiter.group(uri)
+        attempt = 0
+        while True:
+            self.limiter.acquire(group)
+            headers["Authorization"] = self.signer.authorization(method, uri, params)
+            start = _clock()
+            try:
+                response, content = self.pool.request(method, path, body, headers)
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.record(
+                        method,
+                        uri,
+                        "error",
+                        _clock() - start,
+                        len(body or b""),
+                        0,
+                        attempt,
+                    )
+                raise
+            if self.metrics is not None:
+                self.metrics.record(
+                    method,
+                    uri,
+                    response.status,
+                    _clock() - start,
+                    len(body or b""),
+                    len(content or b""),
+                    attempt,
+                )
+            if response.status not in RateLimiter.THROTTLED:
+                self.limiter.succeeded(group)
+                return response, content
+            if attempt >= self.limiter.max_retries:
+                return response, content
+            self.limiter.throttled(group, attempt, response.get("retry-after"))
+            attempt += 1
 
 
 class _DeHTMLParser(HTMLParser):
@@ -103,40 +771,194 @@ class _DeHTMLParser(HTMLParser):
         return "".join(self.__text).strip()
 
 
+_ATTRS = r"""(?:[^>"']|"[^"]*"|'[^']*')*"""
+_COMMENTS = re.compile(r"<!--.*?-->|<[!?][^>]*>", re.S)
+_CDATA = re.compile(r"<(script|style)\b" + _ATTRS + r">(.*?)</\1\s*>", re.S | re.I)
+_CDATA_OPEN = re.compile(r"<(?:script|style)\b" + _ATTRS + r">.*", re.S | re.I)
+_BR_CLOSED = re.compile(r"<br(?=[\s/>])" + _ATTRS + r"/>", re.I)
+_BR = re.compile(r"<br(?=[\s/>])" + _ATTRS + r">", re.I)
+_P = re.compile(r"<p(?=[\s>])" + _ATTRS + r"(?<!/)>", re.I)
+_TAGS = re.compile(r"</?[a-zA-Z][^\s/>]*" + _ATTRS + r">")
+_MARKERS = re.compile(r"([\x00-\x03])")
+_SPACES = re.compile(r"[ \t\r\n]+")
+_MARKER_TEXT = {"\x00": "", "\x01": "\n\n", "\x02": "\n\n", "\x03": "\n"}
+
+
+def _cdata(match):
+    # script/style content is passed through verbatim, so escape it to
+    # survive the tag substitutions and unescape() unchanged
+    content = match.group(2).replace("&", "&amp;").replace("<", "&lt;")
+    return "\x00" + content + "\x00"
+
+
+def _dehtml_regex(text):
+    """
+    Same output as _DeHTMLParser, but tags are replaced with marker
+    characters by a fixed sequence of precompiled substitutions, and the
+    text chunks between markers are cleaned up in bulk.
+    """
+    if "<s" in text or "<S" in text:
+        text = _CDATA.sub(_cdata, text)
+        # an unterminated script or style swallows the rest of the document
+        text = _CDATA_OPEN.sub("\x00", text, 1)
+    text = _COMMENTS.sub("\x00", text)
+    text = _BR_CLOSED.sub("\x02", text)
+    text = _BR.sub("\x03", text)
+    text = _P.sub("\x01", text)
+    text = _TAGS.sub("\x00", text)
+    if "&" in text:
+        text = unescape(text)
+    text = text.replace("\n", " ").replace("\t", " ").replace("\r", " ")
+    while "  " in text:
+        text = text.replace("  ", " ")
+    parts = _MARKERS.split(text)
+    chunks = [chunk.strip() for chunk in parts[::2]]
+    parts[::2] = [chunk + " " if chunk else chunk for chunk in chunks]
+    parts[1::2] = map(_MARKER_TEXT.__getitem__, parts[1::2])
+    return "".join(parts).strip()
+
+
+def _dehtml_htmlparser(text):
+    parser = _DeHTMLParser()
+    parser.feed(text)
+    parser.close()
+    return parser.text()
+
+
+def _dehtml_lxml(text):
+    """
+    C-accelerated backend using lxml, when installed. lxml cannot tell
+    <br> from <br/>, so both become a single newline.
+    """
+    from lxml import etree
+    from lxml.html import document_fromstring
+
+    out = []
+    append = out.append
+    collapse = _SPACES.sub
+
+    def data(chunk):
+        chunk = chunk.strip()
+        if chunk:
+            append(collapse(" ", chunk) + " ")
+
+    for event, element in etree.iterwalk(
+        document_fromstring(text), events=("start", "end")
+    ):
+        if event == "start":
+            tag = element.tag
+            if tag == "p":
+                append("\n\n")
+            elif tag == "br":
+                append("\n")
+            if element.text and isinstance(tag, str):
+                data(element.text)
+        elif element.tail:
+            data(element.tail)
+    return "".join(out).strip()
+
+
+def _lxml_available():
+    try:
+        import lxml.html  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+DEHTML_BACKENDS = {
+    "regex": _dehtml_regex,
+    "htmlparser": _dehtml_htmlparser,
+    "lxml": _dehtml_lxml,
+}
+_dehtml_backend = None
+
+
+def set_dehtml_backend(name):
+    """
+    Selects the html-to-text backend used by dehtml(): regex (default),
+    htmlparser (the reference implementation) or lxml (requires lxml).
+    """
+    global _dehtml_backend
+    if name == "lxml" and not _lxml_available():
+        raise InstapaperException("The lxml dehtml backend requires lxml.")
+    _dehtml_backend = DEHTML_BACKENDS[name]
+
+
 def dehtml(text):
+    if not text:
+        return None
+    if sys.version_info < (3, 0) and isinstance(text, str):
+        text = text.decode("UTF-8")
+    if _dehtml_backend is None:
+        set_dehtml_backend(os.getenv("DEHTML_BACKEND", "regex"))
+    return _dehtml_backend(text)
+
+
+def _dehtml_indexed(item):
+    return item[0], dehtml(item[1])
+
+
+def dehtml_many(iterable, processes=None, chunksize=16, ordered=True):
+    """
+    Converts many html documents to text across a process pool, streaming
+    results as chunks complete.
+
+    iterable: Required. Iterable of html strings.
+    processes: Optional. Number of worker processes, default cpu_count().
+    chunksize: Optional. Documents sent to a worker at a time.
+    ordered: Optional. Yield texts in input order (default), or yield
+             (index, text) pairs in completion order when False.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    items = enumerate(iterable)
+    if processes == 1:
+        results = (_dehtml_indexed(item) for item in items)
+    else:
+        pool = multiprocessing.Pool(processes)
+        imap = pool.imap if ordered else pool.imap_unordered
+        results = imap(_dehtml_indexed, items, chunksize)
     try:
-        parser = _DeHTMLParser()
-        if text:
-            if sys.version_info < (3, 0):
-                text = text.decode("UTF-8")
+        for index, text in results:
+            yield text if ordered else (index, text)
+    finally:
+        if processes != 1:
+            pool.terminate()
 
-        else:
-            return None
-        parser.feed(text)
-        parser.close()
-        return parser.text()
-    except:
-        print_exc(file=stderr)
-        return text
+
+def fill_texts(bookmarks, processes=None, chunksize=16):
+    """
+    Fills in `text` for a list of Bookmarks at once, converting their html
+    across a process pool. Html that is not loaded yet is fetched first;
+    use Instapaper.fetch_texts to fetch it concurrently. Returns the list.
+
+    bookmarks: Required. List of Bookmark objects.
+    processes: Optional. Number of worker processes, default cpu_count().
+    """
+    pending = [b for b in bookmarks if not b._has_text()]
+    texts = dehtml_many((b.html for b in pending), processes, chunksize, ordered=False)
+    for index, text in texts:
+        pending[index]._set_text(text)
+    return bookmarks
+
+
+_intern = sys.intern if sys.version_info > (3, 0) else intern  # noqa: F821
+_MISSING = object()
 
 
 class Bookmark(object):
-    def __init__(self, parent, params):
-        self.parent = parent
-        self.__text = None
-        self.__html = None
-        self.__dict__.update(params)
-        """
+    """
+    Bookmark record. Known API fields live in __slots__, unknown fields in
+    a small overflow dict, and `starred` and the timestamps are decoded on
+    first access.
+
         {'hash': '21iTZfCr',
         'description': u'',
-        'parent': <instapaper.Instapaper object at 0x104055ad0>,
         'title': u'Let\u2019s Ignore Each Other Together',
         'url': 'https://medium.com/re-form/lets-ignore-each-other-together-d7cf46a8a8ad',
-        '_Bookmark__html': None,
         'time': 1422657611,
         'progress_timestamp': 1422662236,
         'bookmark_id': 550386320,
-        '_Bookmark__text': None,
         'progress': 0.0,
         'starred': '0',
         'type': 'bookmark',
@@ -144,11 +966,72 @@ class Bookmark(object):
         'private_source': u'',
         # is_private_from_source is used for adding a bookmark
         'is_private_from_source': u''}
-        """
+    """
+
+    FIELDS = (
+        "bookmark_id",
+        "url",
+        "title",
+        "description",
+        "hash",
+        "type",
+        "progress",
+        "private_source",
+        "content",
+        "is_private_from_source",
+    )
+    INTERNED = ("type", "private_source")
+    __slots__ = FIELDS + (
+        "parent",
+        "_starred",
+        "_time",
+        "_progress_timestamp",
+        "_extra",
+        "__html",
+        "__text",
+    )
+
+    # fields sent to bookmarks/add by save()
+    SAVE_FIELDS = ("url", "title", "description", "content", "is_private_from_source")
+
+    def __init__(self, parent, params):
+        _set = object.__setattr__
+        _set(self, "parent", parent)
+        _set(self, "_extra", None)
+        _set(self, "_starred", False)
+        self.__text = None
+        self.__html = None
+        setters = _BOOKMARK_SETTERS
+        for key, value in params.items():
+            setter = setters.get(key)
+            if setter is None:
+                setattr(self, key, value)
+            else:
+                if key in self.INTERNED and isinstance(value, str):
+                    value = _intern(value)
+                setter(self, value)
+
+    def __setattr__(self, name, value):
         try:
-            self.starred = self.starred == "1"  # convert to boolean
-        except:
-            self.starred = False
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            if self._extra is None:
+                object.__setattr__(self, "_extra", {})
+            self._extra[name] = value
+
+    def __getattr__(self, name):
+        # only called for unset slots and unknown fields
+        if name != "_extra" and self._extra and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(name)
+
+    def __delattr__(self, name):
+        try:
+            object.__delattr__(self, name)
+        except AttributeError:
+            if not self._extra or name not in self._extra:
+                raise
+            del self._extra[name]
 
     def __str__(self):
         return "{}\n{}\n{}".format(
@@ -157,31 +1040,135 @@ class Bookmark(object):
             self.url,
         )
 
+    @property
+    def starred(self):
+        starred = self._starred
+        if starred is not True and starred is not False:
+            starred = starred in ("1", 1)  # convert to boolean
+            object.__setattr__(self, "_starred", starred)
+        return starred
+
+    @starred.setter
+    def starred(self, value):
+        object.__setattr__(self, "_starred", value)
+
+    def _timestamp(self, name):
+        value = getattr(self, name)
+        if value is not None and not isinstance(value, int):
+            value = int(float(value))
+            object.__setattr__(self, name, value)
+        return value
+
+    @property
+    def time(self):
+        return self._timestamp("_time")
+
+    @time.setter
+    def time(self, value):
+        object.__setattr__(self, "_time", value)
+
+    @property
+    def progress_timestamp(self):
+        return self._timestamp("_progress_timestamp")
+
+    @progress_timestamp.setter
+    def progress_timestamp(self, value):
+        object.__setattr__(self, "_progress_timestamp", value)
+
+    def to_dict(self):
+        """
+        Returns the bookmark's API fields as a plain dictionary.
+        """
+        record = dict(self._extra or {})
+        for name in self.FIELDS + ("starred", "time", "progress_timestamp"):
+            try:
+                record[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return record
+
     @property
     def html(self):
         if self.__html is None:
-            response, html = self.parent.http.request(
-                "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_TEXT_]),
-                method="POST",
-                body=urlencode(
-                    {
-                        "bookmark_id": self.bookmark_id,
-                    }
-                ),
-            )
-            if response.get("status") == "200":
-                self.__html = html.decode("utf-8")
+            self._fetch_html(self.parent.http)
+        return self.__html
+
+    def _cache_key(self):
+        cache = getattr(self.parent, "cache", None)
+        if cache is None or not getattr(self, "hash", None):
+            return None, None
+        return cache, (self.bookmark_id, self.hash)
+
+    def _fetch_html(self, http):
+        """
+        Fetches and caches the article html using the given http client,
+        unless it is already loaded or the client's ArticleCache has it.
+        """
+        if self.__html is not None:
+            return self.__html
+        cache, key = self._cache_key()
+        if cache is not None:
+            self.__html = cache.get(*key)
+            if self.__html is not None:
+                return self.__html
+        response, html = http.request(
+            self.parent.urls[_BOOKMARKS_TEXT_],
+            method="POST",
+            body=urlencode(
+                {
+                    "bookmark_id": self.bookmark_id,
+                }
+            ),
+        )
+        if response.get("status") == "200":
+            self.__html = html.decode("utf-8")
+            if cache is not None:
+                cache.put(key[0], key[1], self.__html)
         return self.__html
 
     @property
     def text(self):
         if self.__text is None:
-            self.__text = dehtml(self.html)
+            cache, key = self._cache_key()
+            if cache is not None:
+                self.__text = cache.get(key[0], key[1], "text")
+            if self.__text is None:
+                self.__text = dehtml(self.html)
+                if cache is not None and self.__text is not None:
+                    cache.put(key[0], key[1], self.__text, "text")
+            self._index_text()
         return self.__text
 
+    def _index_text(self):
+        search = getattr(self.parent, "search", None)
+        if search is not None and self.__text is not None:
+            search.update(self.bookmark_id, text=self.__text)
+
+    def _has_text(self):
+        return self.__text is not None
+
+    def _set_text(self, text):
+        self.__text = text
+        cache, key = self._cache_key()
+        if cache is not None and text is not None:
+            cache.put(key[0], key[1], text, "text")
+        self._index_text()
+
+    def _queued(self, op, *args):
+        """
+        Queues a mutation on the caller's active batch, if there is one.
+        """
+        batch = getattr(self.parent._local, "batch", None)
+        if batch is None:
+            return False
+        batch.add(self, op, *args)
+        return True
+
     def star(self):
+        if self._queued("star"):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_STAR_]),
+            self.parent.urls[_BOOKMARKS_STAR_],
             method="POST",
             body=urlencode(
                 {
@@ -195,8 +1182,10 @@ class Bookmark(object):
         return False
 
     def unstar(self):
+        if self._queued("unstar"):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_UNSTAR_]),
+            self.parent.urls[_BOOKMARKS_UNSTAR_],
             method="POST",
             body=urlencode(
                 {
@@ -210,8 +1199,10 @@ class Bookmark(object):
         return False
 
     def archive(self):
+        if self._queued("archive"):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_ARCHIVE_]),
+            self.parent.urls[_BOOKMARKS_ARCHIVE_],
             method="POST",
             body=urlencode(
                 {
@@ -225,8 +1216,10 @@ class Bookmark(object):
         return False
 
     def unarchive(self):
+        if self._queued("unarchive"):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_UNARCHIVE_]),
+            self.parent.urls[_BOOKMARKS_UNARCHIVE_],
             method="POST",
             body=urlencode(
                 {
@@ -240,8 +1233,10 @@ class Bookmark(object):
         return False
 
     def delete(self):
+        if self._queued("delete"):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_DELETE_]),
+            self.parent.urls[_BOOKMARKS_DELETE_],
             method="POST",
             body=urlencode(
                 {
@@ -250,61 +1245,41 @@ class Bookmark(object):
             ),
         )
         if response.get("status") == "200":
+            if getattr(self.parent, "search", None) is not None:
+                self.parent.search.delete([self.bookmark_id])
             return True
         return False
 
-    def save(self, folder_id=None):
-        # add appropriate parameters to a dictionary for encoding
+    def _add(self, folder_id=None):
         encoded_values = {}
-        try:
-            if self.content:
-                encoded_values["content"] = self.content
-        except:
-            pass
-
-        try:
-            if self.is_private_from_source:
-                encoded_values["is_private_from_source"] = self.is_private_from_source
-        except:
-            pass
-
-        try:
-            if self.url:
-                encoded_values["url"] = self.url
-        except:
-            pass
-
-        try:
-            if self.title:
-                encoded_values["title"] = self.title
-        except:
-            pass
-
-        try:
-            if self.description:
-                encoded_values["description"] = self.description
-        except:
-            pass
-
-        try:
-            if folder_id:
-                encoded_values["folder_id"] = folder_id
-        except:
-            pass
+        for name in self.SAVE_FIELDS:
+            value = getattr(self, name, None)
+            if value:
+                encoded_values[name] = value
+        if folder_id:
+            encoded_values["folder_id"] = folder_id
 
-        # send the http request
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_ADD_]),
+            self.parent.urls[_BOOKMARKS_ADD_],
             method="POST",
             body=urlencode(encoded_values),
         )
         if response.get("status") == "200":
             self.__html = html
+            added = _parse_added(html)
+            if added is not None:
+                self.bookmark_id = added["bookmark_id"]
+        return response, html
+
+    def save(self, folder_id=None):
+        self._add(folder_id)
         return self.__html
 
     def move(self, folder_id):
+        if self._queued("move", folder_id):
+            return None
         response, html = self.parent.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_MOVE_]),
+            self.parent.urls[_BOOKMARKS_MOVE_],
             method="POST",
             body=urlencode({"bookmark_id": self.bookmark_id, "folder_id": folder_id}),
         )
@@ -312,16 +1287,49 @@ class Bookmark(object):
             return True
         return False
 
+    def update_progress(self, progress, progress_timestamp=None):
+        """
+        Records how far the bookmark has been read. Goes through the
+        client's ProgressBuffer when it has one, otherwise is sent now.
+        Returns False without a request when the bookmark already has a
+        newer progress_timestamp.
+
+        progress: Required. Fraction read, between 0.0 and 1.0.
+        progress_timestamp: Optional. Unix time of the change, default now.
+        """
+        progress_timestamp = int(progress_timestamp or time.time())
+        if progress_timestamp < (getattr(self, "progress_timestamp", None) or 0):
+            return False
+        buffer = getattr(self.parent, "progress_buffer", None)
+        if buffer is not None:
+            buffer.add(self.bookmark_id, progress, progress_timestamp)
+            self.progress = progress
+            self.progress_timestamp = progress_timestamp
+            return None
+        return self._update_progress(progress, progress_timestamp)
+
+    def _update_progress(self, progress, progress_timestamp):
+        response, data = self.parent.http.request(
+            self.parent.urls[_BOOKMARKS_UPDATE_READ_PROGRESS_],
+            method="POST",
+            body=urlencode(
+                {
+                    "bookmark_id": self.bookmark_id,
+                    "progress": progress,
+                    "progress_timestamp": progress_timestamp,
+                }
+            ),
+        )
+        if response.get("status") == "200":
+            self.progress = progress
+            self.progress_timestamp = progress_timestamp
+            return True
+        return False
+
     def get_highlights(self):
         response, data = self.parent.http.request(
             "/".join(
-                [
-                    _BASE_,
-                    _API_VERSION_,
-                    "bookmarks",
-                    str(self.bookmark_id),
-                    "highlights",
-                ]
+                [self.parent.api, "bookmarks", str(self.bookmark_id), "highlights"]
             ),
             method="POST",
         )
@@ -330,6 +1338,24 @@ class Bookmark(object):
         else:
             raise Exception(response)
 
+    def highlights(self, refresh=False):
+        """
+        Returns the bookmark's highlights as a list of Highlight objects,
+        from the client's highlight cache when possible.
+
+        refresh: Optional. Bypass the cache.
+        """
+        cache = self.parent.highlight_cache
+        highlights = None if refresh else cache.get(self.bookmark_id)
+        if highlights is None:
+            highlights = [
+                Highlight(self.parent, record)
+                for record in _loads(self.get_highlights())
+                if record.get("type", "highlight") == "highlight"
+            ]
+            cache.put(self.bookmark_id, highlights)
+        return highlights
+
     def create_highlight(self, highlight_text, position=0):
         """
         highlight_text: Required. The text for the highlight
@@ -337,12 +1363,13 @@ class Bookmark(object):
         """
         response, data = self.parent.http.request(
             "/".join(
-                [_BASE_, _API_VERSION_, "bookmarks", str(self.bookmark_id), "highlight"]
+                [self.parent.api, "bookmarks", str(self.bookmark_id), "highlight"]
             ),
             method="POST",
             body=urlencode({"text": highlight_text, "position": position}),
         )
         if response.get("status") == "200":
+            self.parent.highlight_cache.invalidate(self.bookmark_id)
             return data.decode()
         else:
             raise Exception(response)
@@ -351,15 +1378,1427 @@ class Bookmark(object):
         """
         highlight_id: Required. ID of the highlight.
         """
-        response, data = self.parent.http.request(
-            "/".join(
-                [_BASE_, _API_VERSION_, _HIGHLIGHTS_, str(highlight_id), "delete"]
-            ),
-            method="POST",
+        return self.parent.delete_highlight(highlight_id)
+
+
+# slot setters for known fields, bypassing Bookmark.__setattr__
+_BOOKMARK_SETTERS = dict(
+    [(name, Bookmark.__dict__[name].__set__) for name in Bookmark.FIELDS]
+    + [
+        (name, Bookmark.__dict__["_" + name].__set__)
+        for name in ("starred", "time", "progress_timestamp")
+    ]
+)
+
+
+class Highlight(object):
+    """
+    Highlight record, as returned by bookmarks/<id>/highlights.
+
+        {'highlight_id': 42,
+        'bookmark_id': 550386320,
+        'text': u'the highlighted passage',
+        'note': None,
+        'time': 1422662236,
+        'position': 0,
+        'type': 'highlight'}
+    """
+
+    FIELDS = ("highlight_id", "bookmark_id", "text", "note", "time", "position")
+
+    __slots__ = FIELDS + ("parent",)
+
+    def __init__(self, parent, params):
+        self.parent = parent
+        for name in self.FIELDS:
+            setattr(self, name, params.get(name))
+
+    def __repr__(self):
+        return "<Highlight {} of bookmark {}>".format(
+            self.highlight_id, self.bookmark_id
         )
-        if response.get("status") == "200":
-            return True
+
+    def to_dict(self):
+        """
+        Returns the highlight's API fields as a plain dictionary.
+        """
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    def delete(self):
+        return self.parent.delete_highlight(self.highlight_id)
+
+
+def _highlight_key(text):
+    return " ".join(text.split()).lower()
+
+
+class HighlightCache(object):
+    """
+    Thread-safe in-memory cache of highlights per bookmark, with an index
+    from highlight text back to the highlights (and so bookmarks) holding
+    it. Entries are invalidated when highlights are created or deleted
+    through the client.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__bookmarks = {}
+        self.__owners = {}
+        self.__text = {}
+
+    def __len__(self):
+        return len(self.__bookmarks)
+
+    def get(self, bookmark_id):
+        """
+        Returns the cached list of Highlights for a bookmark, or None.
+        """
+        with self.__lock:
+            highlights = self.__bookmarks.get(str(bookmark_id))
+            return None if highlights is None else list(highlights)
+
+    def put(self, bookmark_id, highlights):
+        with self.__lock:
+            self.__drop(str(bookmark_id))
+            self.__bookmarks[str(bookmark_id)] = list(highlights)
+            for highlight in highlights:
+                self.__owners[str(highlight.highlight_id)] = str(bookmark_id)
+                key = _highlight_key(highlight.text or "")
+                self.__text.setdefault(key, []).append(highlight)
+
+    def invalidate(self, bookmark_id=None, highlight_id=None):
+        """
+        Drops a bookmark's highlights, given its id or one of its
+        highlight ids.
+        """
+        with self.__lock:
+            if bookmark_id is None:
+                bookmark_id = self.__owners.get(str(highlight_id))
+            if bookmark_id is not None:
+                self.__drop(str(bookmark_id))
+
+    def __drop(self, bookmark_id):
+        for highlight in self.__bookmarks.pop(bookmark_id, ()):
+            self.__owners.pop(str(highlight.highlight_id), None)
+            key = _highlight_key(highlight.text or "")
+            matches = [h for h in self.__text.get(key, ()) if h is not highlight]
+            if matches:
+                self.__text[key] = matches
+            else:
+                self.__text.pop(key, None)
+
+    def find(self, text):
+        """
+        Returns the cached Highlights whose text matches text, ignoring
+        case and whitespace. Each has the bookmark_id it belongs to.
+        """
+        with self.__lock:
+            return list(self.__text.get(_highlight_key(text), ()))
+
+    def search(self, text):
+        """
+        Returns the cached Highlights whose text contains text, ignoring
+        case and whitespace.
+        """
+        key = _highlight_key(text)
+        with self.__lock:
+            return [
+                highlight
+                for indexed, highlights in self.__text.items()
+                if key in indexed
+                for highlight in highlights
+            ]
+
+
+class BookmarkSet(object):
+    """
+    Columnar container for bulk bookmark results: one list per field
+    instead of one object per record. Bookmark objects are built on access.
+
+    parent: Required. Instapaper client the bookmarks belong to.
+    records: Optional. Iterable of Bookmark objects or API dicts.
+    """
+
+    def __init__(self, parent, records=()):
+        self.parent = parent
+        self.columns = {}
+        self.__size = 0
+        self.extend(records)
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        for i in range(self.__size):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return BookmarkSet(
+                self.parent, (self[i] for i in range(*index.indices(self.__size)))
+            )
+        if index < 0:
+            index += self.__size
+        if not 0 <= index < self.__size:
+            raise IndexError(index)
+        return Bookmark(
+            self.parent,
+            dict(
+                (name, column[index])
+                for name, column in self.columns.items()
+                if column[index] is not _MISSING
+            ),
+        )
+
+    def append(self, record):
+        if isinstance(record, Bookmark):
+            record = record.to_dict()
+        size = self.__size
+        for name, value in record.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [_MISSING] * size
+            if name in Bookmark.INTERNED and isinstance(value, str):
+                value = _intern(value)
+            column.append(value)
+        self.__size = size = size + 1
+        for column in self.columns.values():
+            if len(column) < size:
+                column.append(_MISSING)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def column(self, name):
+        """
+        Returns the values of one field, with None for missing values.
+        """
+        return [
+            None if value is _MISSING else value
+            for value in self.columns.get(name, [_MISSING] * self.__size)
+        ]
+
+
+class ArticleCache(object):
+    """
+    Persistent on-disk cache of article html and extracted text, keyed by
+    bookmark_id and the bookmark's `hash`, so a changed hash invalidates
+    the entry. Entries are zlib-compressed, read through mmap, and the
+    least recently used ones are evicted once the cache exceeds max_bytes.
+
+    path: Required. Cache directory, created if needed.
+    max_bytes: Optional. Size limit of the compressed entries, default 512MB.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()  # filename -> size, oldest first
+        self.__ids = {}  # bookmark_id -> set of filenames
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        names = [n for n in os.listdir(path) if n.endswith(".z")]
+        stats = dict((n, os.stat(os.path.join(path, n))) for n in names)
+        for name in sorted(names, key=lambda n: stats[n].st_mtime):
+            self._add(name, stats[name].st_size)
+
+    @staticmethod
+    def _name(bookmark_id, hash, kind):
+        hash = "".join(c for c in str(hash) if c.isalnum() or c in "-_")
+        return "{}-{}.{}.z".format(bookmark_id, hash, kind)
+
+    def _add(self, name, size):
+        self.__entries[name] = size
+        self.__ids.setdefault(name.split("-", 1)[0], set()).add(name)
+        self.size += size
+
+    def _remove(self, name):
+        self.size -= self.__entries.pop(name)
+        names = self.__ids.get(name.split("-", 1)[0])
+        names.discard(name)
+        if not names:
+            del self.__ids[name.split("-", 1)[0]]
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    def get(self, bookmark_id, hash, kind="html"):
+        """
+        Returns the cached html (or kind="text") for a bookmark, or None.
+        """
+        name = self._name(bookmark_id, hash, kind)
+        with self.__lock:
+            if name not in self.__entries:
+                return None
+            self.__entries[name] = self.__entries.pop(name)  # most recent
+        filename = os.path.join(self.path, name)
+        try:
+            with open(filename, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    value = zlib.decompress(data).decode("utf-8")
+                finally:
+                    data.close()
+            os.utime(filename, None)
+        except (OSError, ValueError, zlib.error):
+            with self.__lock:
+                if name in self.__entries:
+                    self._remove(name)
+            return None
+        return value
+
+    def put(self, bookmark_id, hash, value, kind="html"):
+        """
+        Stores html (or kind="text") for a bookmark, dropping entries
+        stored under an older hash.
+        """
+        name = self._name(bookmark_id, hash, kind)
+        data = zlib.compress(value.encode("utf-8"))
+        filename = os.path.join(self.path, name)
+        tmp = "{}.{}.tmp".format(filename, threading.current_thread().ident)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.rename(tmp, filename)
+        with self.__lock:
+            if name in self.__entries:
+                self.size -= self.__entries.pop(name)
+            current = name.rsplit(".", 2)[0] + "."
+            for stale in list(self.__ids.get(str(bookmark_id), ())):
+                if not stale.startswith(current):
+                    self._remove(stale)
+            self._add(name, len(data))
+            while self.size > self.max_bytes and len(self.__entries) > 1:
+                self._remove(next(iter(self.__entries)))
+
+    def clear(self):
+        with self.__lock:
+            for name in list(self.__entries):
+                self._remove(name)
+
+
+class CredentialCache(object):
+    """
+    Persistent cache of access tokens keyed by consumer key and username,
+    so short-lived processes can skip the xAuth exchange. The file is only
+    readable by its owner; passwords are never stored.
+
+    path: Optional. JSON file, default ~/.instapaper/tokens.json.
+    """
+
+    def __init__(self, path="~/.instapaper/tokens.json"):
+        self.path = os.path.expanduser(path)
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def _key(consumer_key, username):
+        return "{}:{}".format(consumer_key, username)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, tokens):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(tokens, f)
+        os.rename(tmp, self.path)
+
+    def get(self, consumer_key, username):
+        """
+        Returns the cached (oauth_token, oauth_token_secret), or None.
+        """
+        with self.__lock:
+            token = self._read().get(self._key(consumer_key, username))
+        return tuple(token) if token else None
+
+    def put(self, consumer_key, username, oauth_token, oauth_token_secret):
+        with self.__lock:
+            tokens = self._read()
+            tokens[self._key(consumer_key, username)] = [
+                oauth_token,
+                oauth_token_secret,
+            ]
+            self._write(tokens)
+
+    def remove(self, consumer_key, username):
+        with self.__lock:
+            tokens = self._read()
+            if tokens.pop(self._key(consumer_key, username), None) is not None:
+                self._write(tokens)
+
+
+class _ReauthTransport(object):
+    """
+    Wraps the transport of a session restored from a CredentialCache: the
+    first 401 response logs in again with xAuth, refreshes the cache and
+    retries the request once with the new token.
+    """
+
+    def __init__(self, client, transport, username, password):
+        self.client = client
+        self.transport = transport
+        self.username = username
+        self.password = password
+        self.__lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        response, content = self.transport.request(uri, method, body, headers)
+        if response.status != 401:
+            return response, content
+        with self.__lock:
+            if self.client.http is self:
+                self.client.credentials.remove(self.client.oauthkey, self.username)
+                self.client.login(self.username, self.password, cached=False)
+        return self.client.http.request(uri, method, body, headers)
+
+
+def _imap_bounded(func, iterable, workers):
+    """
+    Like ThreadPool.imap_unordered, but reads at most 2 * workers items
+    ahead of the consumer, so unbounded inputs stay in bounded memory.
+    Exceptions raised by func are re-raised to the consumer.
+    """
+    done = queue.Queue()
+
+    def run(item):
+        try:
+            done.put((func(item), None))
+        except Exception as e:
+            done.put((None, e))
+
+    pool = multiprocessing_pool.ThreadPool(workers)
+    try:
+        inflight = 0
+        for item in iterable:
+            pool.apply_async(run, (item,))
+            inflight += 1
+            while inflight >= 2 * workers or (inflight and not done.empty()):
+                result, error = done.get()
+                inflight -= 1
+                if error is not None:
+                    raise error
+                yield result
+        while inflight:
+            result, error = done.get()
+            inflight -= 1
+            if error is not None:
+                raise error
+            yield result
+    finally:
+        pool.terminate()
+
+
+class JSONLWriter(object):
+    """
+    Writes records as JSON lines.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record).encode("utf-8") + b"\n")
+
+    def flush(self):
+        self.f.flush()
+
+
+class ColumnarWriter(object):
+    """
+    Writes records to a compact columnar file: a header followed by
+    row groups, each a length-prefixed, zlib-compressed JSON object of
+    {"rows": n, "columns": {name: [values]}}. Row groups are self-contained,
+    so a file can be appended to after an interruption. See read_columnar.
+
+    f: Required. File object opened for binary writing.
+    row_group_size: Optional. Records buffered per row group.
+    """
+
+    MAGIC = b"IPCOL1\n"
+
+    def __init__(self, f, row_group_size=1000):
+        self.f = f
+        self.row_group_size = row_group_size
+        self.rows = BookmarkSet(None)
+        if f.tell() == 0:
+            f.write(self.MAGIC)
+
+    def write(self, record):
+        self.rows.append(record)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows):
+            group = {
+                "rows": len(self.rows),
+                "columns": dict(
+                    (name, self.rows.column(name)) for name in self.rows.columns
+                ),
+            }
+            data = zlib.compress(json.dumps(group).encode("utf-8"))
+            self.f.write(struct.pack(">I", len(data)) + data)
+            self.rows = BookmarkSet(None)
+        self.f.flush()
+
+
+def read_columnar(path):
+    """
+    Yields the records of a file written by ColumnarWriter as dicts.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(ColumnarWriter.MAGIC)) != ColumnarWriter.MAGIC:
+            raise InstapaperException("{} is not a columnar export.".format(path))
+        while True:
+            size = f.read(4)
+            if len(size) < 4:
+                break
+            group = json.loads(
+                zlib.decompress(f.read(struct.unpack(">I", size)[0])).decode("utf-8")
+            )
+            columns = group["columns"]
+            for i in range(group["rows"]):
+                yield dict(
+                    (name, values[i])
+                    for name, values in columns.items()
+                    if values[i] is not None
+                )
+
+
+EXPORT_FORMATS = {"jsonl": JSONLWriter, "columnar": ColumnarWriter}
+
+
+_TRACKING = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|mc_cid|mc_eid|igshid)$", re.I)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    Returns a canonical form of url for deduplication: lowercase scheme and
+    host, no default port, fragment or tracking parameters, and a path of
+    at least "/". A missing scheme defaults to http.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    parts = urlparse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc += ":{}".format(parts.port)
+    query = "&".join(
+        pair
+        for pair in parts.query.split("&")
+        if pair and not _TRACKING.match(pair.split("=", 1)[0])
+    )
+    return urlparse.urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def _error_message(response, data):
+    """
+    Returns the message of an API error response, or its HTTP status.
+    """
+    try:
+        _raise_error(_loads(data))
+    except (TypeError, ValueError):
+        pass
+    except Exception as e:
+        return str(e)
+    return "HTTP {}".format(response.get("status"))
+
+
+def _parse_added(data):
+    """
+    Returns the bookmark record from a bookmarks/add response, or None.
+    """
+    try:
+        items = _loads(data)
+    except ValueError:
+        return None
+    if isinstance(items, dict):
+        items = [items]
+    for item in items:
+        if isinstance(item, dict) and item.get("type") == "bookmark":
+            return item
+    return None
+
+
+class _BookmarkFileParser(HTMLParser):
+    """
+    Collects links from Netscape bookmark files (browsers, Pocket and
+    Instapaper exports). Links take the innermost heading as their folder.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.records = []
+        self.folders = [None]
+        self.__heading = None
+        self.__pending = None
+        self.__link = None
+        self.__description = None
+
+    def __end_description(self):
+        if self.__description is not None:
+            self.records[-1]["description"] = "".join(self.__description).strip()
+            self.__description = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("dt", "dd", "dl"):
+            self.__end_description()
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.__link = {"url": href, "title": "", "folder": self.folders[-1]}
+        elif tag in ("h1", "h3"):
+            self.__heading = []
+        elif tag in ("dl", "ul"):
+            self.folders.append(self.__pending or self.folders[-1])
+            self.__pending = None
+        elif tag == "dd" and self.records:
+            self.__description = []
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self.__link is not None:
+            self.__link["title"] = self.__link["title"].strip()
+            self.records.append(self.__link)
+            self.__link = None
+        elif tag in ("h1", "h3") and self.__heading is not None:
+            heading = "".join(self.__heading).strip()
+            if heading.lower() != "bookmarks":
+                self.__pending = heading
+            self.__heading = None
+        elif tag in ("dl", "ul"):
+            self.__end_description()
+            if len(self.folders) > 1:
+                self.folders.pop()
+
+    def close(self):
+        HTMLParser.close(self)
+        self.__end_description()
+
+    def handle_data(self, data):
+        if self.__link is not None:
+            self.__link["title"] += data
+        elif self.__heading is not None:
+            self.__heading.append(data)
+        elif self.__description is not None:
+            self.__description.append(data)
+
+
+def _read_html(f, chunk=65536):
+    parser = _BookmarkFileParser()
+    while True:
+        data = f.read(chunk)
+        if not data:
+            break
+        parser.feed(data)
+        for record in parser.records:
+            yield record
+        del parser.records[:]
+    parser.close()
+    for record in parser.records:
+        yield record
+
+
+def _read_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            yield {"url": record} if not isinstance(record, dict) else record
+
+
+# csv column names recognised by read_import, lowercased
+_CSV_COLUMNS = {
+    "url": "url",
+    "title": "title",
+    "description": "description",
+    "selection": "description",
+    "excerpt": "description",
+    "folder": "folder",
+}
+
+
+def _read_csv(f):
+    rows = csv.reader(f)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [_CSV_COLUMNS.get(name.strip().lower()) for name in header]
+    if "url" not in columns:
+        # no header, one url per row
+        columns = ["url"]
+        rows = ([header], rows)
+    else:
+        rows = (rows,)
+    for group in rows:
+        for row in group:
+            record = dict(
+                (name, value)
+                for name, value in zip(columns, row)
+                if name is not None and value
+            )
+            if record.get("url"):
+                yield record
+
+
+IMPORT_FORMATS = {"csv": _read_csv, "jsonl": _read_jsonl, "html": _read_html}
+
+
+def read_import(path, format=None):
+    """
+    Yields import records from a bookmark file as dicts with a url and
+    optional title, description and folder.
+
+    path: Required. Path to a csv, jsonl or Netscape bookmark html file.
+    format: Optional. csv, jsonl or html, default guessed from the file.
+    """
+    with io.open(path, encoding="utf-8", newline="") as f:
+        if format is None:
+            ext = os.path.splitext(path)[1].lower().lstrip(".")
+            format = {"htm": "html", "json": "jsonl", "txt": "csv"}.get(ext, ext)
+        if format not in IMPORT_FORMATS:
+            start = f.read(256).lstrip()
+            f.seek(0)
+            format = {"<": "html", "{": "jsonl", '"': "jsonl"}.get(start[:1], "csv")
+        for record in IMPORT_FORMATS[format](f):
+            yield record
+
+
+ImportResult = namedtuple("ImportResult", "url status bookmark_id error")
+
+
+BatchResult = namedtuple("BatchResult", "bookmark op args result error")
+
+
+class Batch(object):
+    """
+    Queues bookmark mutations made in a `with client.batch():` block,
+    collapses redundant ones and flushes the survivors concurrently on exit.
+    Results are available as a list of BatchResult in `results`.
+
+    - star/unstar and archive/unarchive pairs cancel each other out
+    - only the last move is kept
+    - delete supersedes everything queued before it
+    """
+
+    _OPPOSITES = {
+        "star": "unstar",
+        "unstar": "star",
+        "archive": "unarchive",
+        "unarchive": "archive",
+    }
+
+    def __init__(self, parent, workers=8):
+        self.parent = parent
+        self.workers = workers
+        self.results = []
+        self.__pending = OrderedDict()
+        self.__previous = None
+
+    def __enter__(self):
+        self.__previous = getattr(self.parent._local, "batch", None)
+        self.parent._local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.parent._local.batch = self.__previous
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return sum(len(ops) for bookmark, ops in self.__pending.values())
+
+    def add(self, bookmark, op, *args):
+        """
+        Queues an operation, coalescing it with those already queued.
+        """
+        ops = self.__pending.setdefault(bookmark.bookmark_id, (bookmark, []))[1]
+        if ops and ops[-1][0] == "delete":
+            return
+        if op == "delete":
+            del ops[:]
+        elif op == "move":
+            ops[:] = [o for o in ops if o[0] != "move"]
+        else:
+            group = (op, self._OPPOSITES[op])
+            queued = [o for o in ops if o[0] in group]
+            ops[:] = [o for o in ops if o[0] not in group]
+            if queued and queued[-1][0] != op:
+                return
+        ops.append((op,) + args)
+
+    def flush(self):
+        """
+        Sends queued operations, one bookmark per worker with each bookmark's
+        operations in order, and returns the list of BatchResult.
+        """
+        pending = list(self.__pending.values())
+        self.__pending.clear()
+
+        def run(item):
+            bookmark, ops = item
+            results = []
+            for op in ops:
+                try:
+                    result = getattr(bookmark, op[0])(*op[1:])
+                    results.append(BatchResult(bookmark, op[0], op[1:], result, None))
+                except Exception as e:
+                    results.append(BatchResult(bookmark, op[0], op[1:], False, e))
+            return results
+
+        pool = multiprocessing_pool.ThreadPool(self.workers)
+        try:
+            for results in pool.imap_unordered(run, [p for p in pending if p[1]]):
+                self.results.extend(results)
+        finally:
+            pool.terminate()
+        return self.results
+
+
+FolderPlan = namedtuple("FolderPlan", "create move delete")
+
+
+class ProgressBuffer(object):
+    """
+    Write-behind buffer for Bookmark.update_progress. Updates are coalesced
+    to the latest per bookmark and sent on a timer, when max_pending
+    bookmarks are waiting, or on flush()/close(). With a path, every
+    update is appended to a journal first, so updates still pending after
+    a crash are loaded by the next ProgressBuffer on the same path and sent
+    with its first flush.
+
+    Updates older than the server's progress_timestamp, as seen on listed
+    bookmarks (see reconcile), are dropped instead of overwriting it.
+
+    path: Optional. Journal file for pending updates.
+    interval: Optional. Seconds to hold updates before flushing, default 5.
+    max_pending: Optional. Flush as soon as this many bookmarks are pending.
+    workers: Optional. Number of concurrent requests when flushing.
+    """
+
+    def __init__(self, path=None, interval=5.0, max_pending=100, workers=8):
+        self.parent = None
+        self.path = path
+        self.interval = interval
+        self.max_pending = max_pending
+        self.workers = workers
+        self.results = []
+        self.__pending = OrderedDict()
+        self.__server = {}
+        self.__lock = threading.RLock()
+        self.__timer = None
+        self.__journal = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        bookmark_id, progress, timestamp = json.loads(line)
+                    except ValueError:
+                        continue  # torn write at crash time
+                    self.__put(bookmark_id, progress, timestamp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def pending(self):
+        """
+        Returns a dict of bookmark_id -> (progress, progress_timestamp).
+        """
+        with self.__lock:
+            return dict(self.__pending)
+
+    def __put(self, bookmark_id, progress, timestamp):
+        if timestamp < self.__server.get(bookmark_id, 0):
+            return False
+        previous = self.__pending.get(bookmark_id)
+        if previous is not None and timestamp < previous[1]:
+            return False
+        self.__pending[bookmark_id] = (progress, timestamp)
+        return True
+
+    def add(self, bookmark_id, progress, progress_timestamp):
+        """
+        Queues an update, keeping only the latest one per bookmark.
+        """
+        bookmark_id = int(bookmark_id)
+        with self.__lock:
+            if not self.__put(bookmark_id, progress, progress_timestamp):
+                return
+            if self.path:
+                if self.__journal is None:
+                    self.__journal = open(self.path, "a")
+                self.__journal.write(
+                    json.dumps([bookmark_id, progress, progress_timestamp]) + "\n"
+                )
+                self.__journal.flush()
+            full = len(self.__pending) >= self.max_pending
+            if not full and self.__timer is None and self.interval:
+                self.__timer = threading.Timer(self.interval, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+        if full:
+            self.flush()
+
+    def reconcile(self, bookmarks):
+        """
+        Records the server's progress_timestamp for listed bookmarks and
+        drops pending updates older than it.
+        """
+        with self.__lock:
+            dropped = False
+            for bookmark in bookmarks:
+                timestamp = getattr(bookmark, "progress_timestamp", None) or 0
+                bookmark_id = bookmark.bookmark_id
+                self.__server[bookmark_id] = max(
+                    timestamp, self.__server.get(bookmark_id, 0)
+                )
+                pending = self.__pending.get(bookmark_id)
+                if pending is not None and pending[1] < timestamp:
+                    del self.__pending[bookmark_id]
+                    dropped = True
+            if dropped:
+                self.__compact()
+
+    def __compact(self):
+        # rewrites the journal with only what is still pending
+        if self.__journal is not None:
+            self.__journal.close()
+            self.__journal = None
+        if not self.path:
+            return
+        if not self.__pending:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for bookmark_id, (progress, timestamp) in self.__pending.items():
+                f.write(json.dumps([bookmark_id, progress, timestamp]) + "\n")
+        os.rename(tmp, self.path)
+
+    def flush(self):
+        """
+        Sends pending updates concurrently and returns their BatchResults.
+        Failed updates stay pending unless a newer one arrived meanwhile.
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            pending = list(self.__pending.items())
+            self.__pending.clear()
+
+        def send(item):
+            bookmark_id, (progress, timestamp) = item
+            bookmark = Bookmark(self.parent, {"bookmark_id": bookmark_id})
+            args = (progress, timestamp)
+            try:
+                result = bookmark._update_progress(progress, timestamp)
+                return BatchResult(bookmark, "update_progress", args, result, None)
+            except Exception as e:
+                return BatchResult(bookmark, "update_progress", args, False, e)
+
+        results = list(_imap_bounded(send, pending, self.workers))
+        with self.__lock:
+            for result in results:
+                bookmark_id = result.bookmark.bookmark_id
+                progress, timestamp = result.args
+                if result.result:
+                    self.__server[bookmark_id] = max(
+                        timestamp, self.__server.get(bookmark_id, 0)
+                    )
+                elif bookmark_id not in self.__pending:
+                    self.__pending[bookmark_id] = (progress, timestamp)
+            self.__compact()
+            self.results.extend(results)
+        return results
+
+    def close(self):
+        """
+        Flushes what is pending and stops the timer. Anything that still
+        fails stays in the journal.
+        """
+        self.flush()
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+
+SyncDelta = namedtuple("SyncDelta", "folder added changed deleted")
+
+
+SearchResult = namedtuple("SearchResult", "bookmark_id score title snippet")
+
+
+class SearchIndex(object):
+    """
+    Local full-text index of bookmark titles, descriptions and article
+    text on SQLite FTS5, ranked with BM25 (title matches weigh most). A
+    client with a search index feeds it as bookmarks are listed and their
+    text is fetched, and removes bookmarks deleted through it or by sync().
+
+    path: Optional. Database file, default in-memory.
+    """
+
+    _SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+        title, description, text, tokenize = 'porter unicode61'
+    );
+    """
+    FIELDS = ("title", "description", "text")
+    WEIGHTS = (4.0, 2.0, 1.0)
+
+    def __init__(self, path=":memory:"):
+        self.path = path = os.path.expanduser(path)
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self.__db.executescript(self._SCHEMA)
+        except sqlite3.OperationalError:
+            raise InstapaperException("SearchIndex requires SQLite with FTS5.")
+
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def _update(self, bookmark_id, fields):
+        fields = [(k, v) for k, v in zip(self.FIELDS, fields) if v is not None]
+        if not fields:
+            return
+        cursor = self.__db.execute(
+            "UPDATE docs SET {} WHERE rowid = ?".format(
+                ", ".join("{} = ?".format(k) for k, v in fields)
+            ),
+            [v for k, v in fields] + [bookmark_id],
+        )
+        if cursor.rowcount:
+            return
+        values = dict(fields)
+        self.__db.execute(
+            "INSERT INTO docs (rowid, title, description, text) VALUES (?, ?, ?, ?)",
+            [bookmark_id] + [values.get(k, "") for k in self.FIELDS],
+        )
+
+    def update(self, bookmark_id, title=None, description=None, text=None):
+        """
+        Indexes the given fields of a bookmark, keeping the others.
+        """
+        with self.__lock, self.__db:
+            self._update(int(bookmark_id), (title, description, text))
+
+    def put_bookmarks(self, bookmarks):
+        """
+        Indexes the titles and descriptions of listed bookmarks.
+        """
+        with self.__lock, self.__db:
+            for bookmark in bookmarks:
+                self._update(
+                    int(bookmark.bookmark_id),
+                    (
+                        getattr(bookmark, "title", None) or "",
+                        getattr(bookmark, "description", None) or "",
+                        None,
+                    ),
+                )
+
+    def delete(self, bookmark_ids):
+        with self.__lock, self.__db:
+            self.__db.executemany(
+                "DELETE FROM docs WHERE rowid = ?", [(int(i),) for i in bookmark_ids]
+            )
+
+    @staticmethod
+    def _match(query):
+        """
+        Returns an FTS5 query matching every word and "quoted phrase" of
+        query; a trailing * on a word matches prefixes.
+        """
+        terms = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+            if phrase.strip():
+                terms.append('"{}"'.format(phrase))
+            elif word:
+                prefix = word.endswith("*")
+                word = word.rstrip("*").replace('"', "")
+                if word:
+                    terms.append('"{}"{}'.format(word, "*" if prefix else ""))
+        return " ".join(terms)
+
+    def query(self, query, limit=20):
+        """
+        Returns up to limit SearchResults for query, best first. Words must
+        all match; "quoted phrases" must match exactly.
+        """
+        match = self._match(query)
+        if not match:
+            return []
+        with self.__lock:
+            rows = self.__db.execute(
+                "SELECT rowid, bm25(docs, ?, ?, ?), title, "
+                "snippet(docs, -1, '[', ']', '...', 12) "
+                "FROM docs WHERE docs MATCH ? ORDER BY bm25(docs, ?, ?, ?) LIMIT ?",
+                self.WEIGHTS + (match,) + self.WEIGHTS + (limit,),
+            ).fetchall()
+        return [SearchResult(row[0], -row[1], row[2], row[3]) for row in rows]
+
+
+class SyncSnapshot(object):
+    """
+    Local record of bookmark_id -> (hash, progress, progress_timestamp)
+    per folder, used to build the `have` parameter for incremental syncs.
+
+    path: Optional. JSON file the snapshot is loaded from and saved to.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.folders = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.folders = dict(
+            (folder, dict((int(k), tuple(v)) for k, v in entries.items()))
+            for folder, entries in data.items()
+        )
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                dict(
+                    (folder, dict((str(k), list(v)) for k, v in entries.items()))
+                    for folder, entries in self.folders.items()
+                ),
+                f,
+            )
+        os.rename(tmp, self.path)
+
+    def have(self, folder):
+        """
+        Returns the `have` string for a folder, e.g. "123:OjMuzFp6:0.5:1288584076,..."
+        """
+        return ",".join(
+            "{}:{}:{}:{}".format(bookmark_id, *entry)
+            for bookmark_id, entry in self.folders.get(str(folder), {}).items()
+        )
+
+    def apply(self, folder, bookmarks, delete_ids):
+        """
+        Applies a server delta to the snapshot, returning (added, changed, deleted).
+        """
+        entries = self.folders.setdefault(str(folder), {})
+        added, changed, deleted = [], [], []
+        for bookmark in bookmarks:
+            entry = (
+                getattr(bookmark, "hash", ""),
+                getattr(bookmark, "progress", 0.0),
+                getattr(bookmark, "progress_timestamp", 0),
+            )
+            previous = entries.get(bookmark.bookmark_id)
+            if previous is None:
+                added.append(bookmark)
+            elif tuple(previous) != entry:
+                changed.append(bookmark)
+            entries[bookmark.bookmark_id] = entry
+        for bookmark_id in delete_ids:
+            if entries.pop(bookmark_id, None) is not None:
+                deleted.append(bookmark_id)
+        return added, changed, deleted
+
+
+class BookmarkStore(object):
+    """
+    Optional local SQLite store of bookmark and folder records, indexed on
+    bookmark_id, folder, starred, time and progress so filters can be
+    answered without an API round trip.
+
+    path: Optional. Database file, default in-memory.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS bookmarks (
+        bookmark_id INTEGER PRIMARY KEY,
+        folder TEXT,
+        starred INTEGER,
+        time INTEGER,
+        progress REAL,
+        progress_timestamp INTEGER,
+        hash TEXT,
+        data TEXT
+    );
+    CREATE INDEX IF NOT EXISTS bookmarks_folder ON bookmarks (folder);
+    CREATE INDEX IF NOT EXISTS bookmarks_starred ON bookmarks (starred);
+    CREATE INDEX IF NOT EXISTS bookmarks_time ON bookmarks (time);
+    CREATE INDEX IF NOT EXISTS bookmarks_progress ON bookmarks (progress);
+    CREATE TABLE IF NOT EXISTS folders (
+        folder_id INTEGER PRIMARY KEY,
+        title TEXT,
+        data TEXT
+    );
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.parent = None
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.executescript(self._SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def put_bookmarks(self, bookmarks, folder):
+        """
+        Writes bookmarks listed from a folder. Listing the "starred"
+        pseudo-folder does not change a bookmark's stored folder.
+        """
+        folder = str(folder)
+        if folder == "starred":
+            target = "COALESCE((SELECT folder FROM bookmarks WHERE bookmark_id = ?), ?)"
+        else:
+            target = "?"
+        rows = []
+        for bookmark in bookmarks:
+            record = bookmark.to_dict()
+            key = (record["bookmark_id"],)
+            if folder == "starred":
+                key += key
+            rows.append(
+                key
+                + (
+                    folder,
+                    int(bool(record.get("starred"))),
+                    record.get("time"),
+                    record.get("progress"),
+                    record.get("progress_timestamp"),
+                    record.get("hash"),
+                    json.dumps(record),
+                )
+            )
+        with self.__lock, self.__db:
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO bookmarks (bookmark_id, folder, starred, "
+                "time, progress, progress_timestamp, hash, data) "
+                "VALUES (?, {}, ?, ?, ?, ?, ?, ?)".format(target),
+                rows,
+            )
+
+    def put_folders(self, folders):
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM folders")
+            self.__db.executemany(
+                "INSERT INTO folders (folder_id, title, data) VALUES (?, ?, ?)",
+                [(f.get("folder_id"), f.get("title"), json.dumps(f)) for f in folders],
+            )
+
+    def delete(self, bookmark_ids):
+        with self.__lock, self.__db:
+            self.__db.executemany(
+                "DELETE FROM bookmarks WHERE bookmark_id = ?",
+                [(bookmark_id,) for bookmark_id in bookmark_ids],
+            )
+
+    def get(self, bookmark_id):
+        """
+        Returns a stored Bookmark by id, or None.
+        """
+        results = self.query(bookmark_id=bookmark_id)
+        return results[0] if results else None
+
+    def folders(self):
+        with self.__lock:
+            rows = self.__db.execute("SELECT data FROM folders").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def query(
+        self,
+        folder=None,
+        starred=None,
+        since=None,
+        until=None,
+        min_progress=None,
+        max_progress=None,
+        bookmark_id=None,
+        limit=None,
+    ):
+        """
+        Returns a BookmarkSet of stored bookmarks matching all of the given
+        filters, newest first.
+
+        folder: Optional. unread, archive or a folder_id value.
+        starred: Optional. True or False.
+        since/until: Optional. Bounds on the bookmark's time.
+        min_progress/max_progress: Optional. Bounds on reading progress.
+        """
+        clauses = []
+        params = []
+        for clause, value in (
+            ("bookmark_id = ?", bookmark_id),
+            ("folder = ?", None if folder is None else str(folder)),
+            ("starred = ?", None if starred is None else int(bool(starred))),
+            ("time >= ?", since),
+            ("time <= ?", until),
+            ("progress >= ?", min_progress),
+            ("progress <= ?", max_progress),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = "SELECT data FROM bookmarks"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY time DESC"
+        if limit:
+            sql += " LIMIT {:d}".format(limit)
+        with self.__lock:
+            rows = self.__db.execute(sql, params).fetchall()
+        return BookmarkSet(self.parent, (json.loads(row[0]) for row in rows))
+
+
+def _orjson_available():
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
         return False
+    return True
+
+
+JSON_BACKENDS = ("orjson", "json")
+_json_loads = None
+
+
+def set_json_backend(name):
+    """
+    Selects the decoder for API responses: orjson (requires orjson, decodes
+    straight from bytes), json, or auto (default) for orjson when installed.
+    """
+    global _json_loads
+    if name == "auto":
+        name = "orjson" if _orjson_available() else "json"
+    if name not in JSON_BACKENDS:
+        raise InstapaperException("Unknown json backend {}.".format(name))
+    if name == "orjson":
+        if not _orjson_available():
+            raise InstapaperException("The orjson json backend requires orjson.")
+        import orjson
+
+        _json_loads = orjson.loads
+    else:
+        _json_loads = json.loads
+
+
+def _loads(data):
+    """
+    Decodes a JSON response body (bytes or text) with the selected backend.
+    """
+    if _json_loads is None:
+        set_json_backend(os.getenv("JSON_BACKEND", "auto"))
+    return _json_loads(data)
+
+
+def _raise_error(items):
+    """
+    Raises the error carried by a decoded response, if any.
+    """
+    if isinstance(items, dict):
+        if "error" in items:
+            raise Exception(items["error"])
+        return
+    for item in items if isinstance(items, list) else [items]:
+        if isinstance(item, dict) and item.get("type") == "error":
+            raise Exception(item.get("message"))
+
+
+def _records(data, key):
+    """
+    Returns the records under `key` in a JSON response body. The json
+    backend walks the body one record at a time (see _iter_records); orjson
+    decodes all of it at once, which is still faster and smaller.
+    """
+    if _json_loads is None:
+        set_json_backend(os.getenv("JSON_BACKEND", "auto"))
+    if _json_loads is json.loads:
+        return _iter_records(data.decode("utf-8"), key)
+    items = _loads(data)
+    _raise_error(items)
+    if not isinstance(items, dict):
+        return ()
+    return items.get(key) or ()
+
+
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def _iter_records(text, key):
+    """
+    Yields the elements of the array stored under `key` in a JSON object,
+    decoding one element at a time instead of the whole document.
+    """
+    skip = _whitespace.match
+    raw_decode = json.JSONDecoder().raw_decode
+    idx = skip(text, 0).end()
+    if text[idx : idx + 1] != "{":
+        _raise_error(json.loads(text))
+        return
+    idx = skip(text, idx + 1).end()
+    while text[idx] != "}":
+        name, idx = raw_decode(text, idx)
+        idx = skip(text, skip(text, idx).end() + 1).end()  # skip ":"
+        if name == key and text[idx] == "[":
+            idx = skip(text, idx + 1).end()
+            while text[idx] != "]":
+                record, idx = raw_decode(text, idx)
+                yield record
+                idx = skip(text, idx).end()
+                if text[idx] == ",":
+                    idx = skip(text, idx + 1).end()
+            idx += 1
+        else:
+            value, idx = raw_decode(text, idx)
+            if name == "error":
+                raise Exception(value)
+        idx = skip(text, idx).end()
+        if text[idx] == ",":
+            idx = skip(text, idx + 1).end()
+
+
+def _parse_ids(ids):
+    """
+    Normalizes a delete_ids value (comma-separated string or list) to ints.
+    """
+    if not ids:
+        return []
+    if not isinstance(ids, list):
+        ids = str(ids).split(",")
+    return [int(i) for i in ids if str(i).strip()]
 
 
 class InstapaperException(Exception):
@@ -371,19 +2810,98 @@ class InstapaperAuthenticationException(InstapaperException):
 
 
 class Instapaper(object):
-    def __init__(self, oauthkey, oauthsec):
+    def __init__(
+        self,
+        oauthkey,
+        oauthsec,
+        store=None,
+        pool_size=10,
+        transport=None,
+        limiter=None,
+        cache=None,
+        metrics=None,
+        base=_BASE_,
+        pool=None,
+        credentials=None,
+        search=None,
+        progress_buffer=None,
+        memo_ttl=0,
+    ):
+        """
+        store: Optional. BookmarkStore that listed bookmarks and folders
+               are written into.
+        cache: Optional. ArticleCache for article html and text.
+        pool_size: Optional. Number of keep-alive connections, default 10.
+        limiter: Optional. RateLimiter shared by all requests, by default
+                 unlimited but backing off on 429/503.
+        transport: Optional. Callable taking an OAuthSigner and returning
+                   the object used as Instapaper.http, default HTTPTransport.
+        metrics: Optional. Metrics registry for the default transport.
+        base: Optional. Root url of the API, e.g. a local stand-in server.
+        pool: Optional. ConnectionPool to share with other clients, instead
+              of a new one of pool_size connections.
+        credentials: Optional. CredentialCache that login() reuses tokens
+                     from.
+        search: Optional. SearchIndex fed with listed bookmarks and fetched
+                article text.
+        progress_buffer: Optional. ProgressBuffer that update_progress
+                         writes behind through.
+        memo_ttl: Optional. Seconds the results of folders() and user()
+                  are reused for, default 0 (always request).
+        """
         if not oauthkey or not oauthsec:
             raise InstapaperAuthenticationException(
                 "No OAuth key or secret found. Please provide both."
             )
-        self.consumer = oauth.Consumer(oauthkey, oauthsec)
-        self.client = oauth.Client(self.consumer)
+        self.oauthkey = oauthkey
+        self.oauthsec = oauthsec
+        self._consumer = None
+        self.base = base
+        self.pool = pool or ConnectionPool(base, pool_size)
+        self.limiter = limiter or RateLimiter()
+        self.metrics = metrics or Metrics()
+        self.transport = transport or (
+            lambda signer: HTTPTransport(signer, self.pool, self.limiter, self.metrics)
+        )
+        self.client = self.transport(OAuthSigner(oauthkey, oauthsec))
+        self.urls = _api_urls(base)
+        self.api = "/".join([base, _API_VERSION_])
         self.token = None
         self.http = None
+        self._local = threading.local()
+        self.store = store
+        self.cache = cache
+        self.highlight_cache = HighlightCache()
+        self.credentials = credentials
+        self.search = search
+        self.progress_buffer = progress_buffer
+        self.memo_ttl = memo_ttl
+        self._memo = {}
+        if store is not None:
+            store.parent = self
+        if progress_buffer is not None:
+            progress_buffer.parent = self
 
-    def login(self, username, password):
+    @property
+    def consumer(self):
+        """
+        The application credentials as an oauth2.Consumer, built on first
+        use so oauth2 is only imported by callers that need it.
+        """
+        if self._consumer is None:
+            self._consumer = oauth.Consumer(self.oauthkey, self.oauthsec)
+        return self._consumer
+
+    @consumer.setter
+    def consumer(self, consumer):
+        self._consumer = consumer
+
+    def _access_token(self, username, password):
+        """
+        Exchanges a username and password for (oauth_token, oauth_token_secret).
+        """
         response, content = self.client.request(
-            "/".join([_BASE_, _API_VERSION_, _ACCESS_TOKEN_]),
+            self.urls[_ACCESS_TOKEN_],
             "POST",
             urlencode(
                 {
@@ -398,22 +2916,115 @@ class Instapaper(object):
                 "User could not be authenticated. Please check that user and OAuth credentials are correct."
             )
         _oauth = dict(urlparse.parse_qsl(content.decode("utf-8")))
-        self.login_with_token(_oauth["oauth_token"], _oauth["oauth_token_secret"])
+        return _oauth["oauth_token"], _oauth["oauth_token_secret"]
+
+    def login(self, username, password, cached=True):
+        """
+        Logs in with xAuth. With a CredentialCache, a cached token is used
+        instead, and replaced on its first 401 response.
+
+        cached: Optional. Use a cached token if there is one.
+        """
+        token = None
+        if self.credentials is not None and cached:
+            token = self.credentials.get(self.oauthkey, username)
+        if token is not None:
+            self.login_with_token(*token)
+            self.http = _ReauthTransport(self, self.http, username, password)
+            return
+        token = self._access_token(username, password)
+        if self.credentials is not None:
+            self.credentials.put(self.oauthkey, username, *token)
+        self.login_with_token(*token)
 
     def login_with_token(self, oauth_token, oauth_token_secret):
         """
         When you want to access a user's data using their existing token
         """
         self.token = oauth.Token(oauth_token, oauth_token_secret)
-        self.http = oauth.Client(self.consumer, self.token)
+        self._memo.clear()
+        self.http = self.transport(
+            OAuthSigner(self.oauthkey, self.oauthsec, oauth_token, oauth_token_secret)
+        )
+
+    def batch(self, workers=8):
+        """
+        Returns a Batch context manager that queues star, unstar, archive,
+        unarchive, move and delete calls and flushes them on exit.
+
+        workers: Optional. Number of concurrent requests when flushing.
+        """
+        return Batch(self, workers)
+
+    def fetch_texts(self, bookmarks, workers=8):
+        """
+        Fetches html and text for many bookmarks over a bounded thread pool,
+        yielding each Bookmark as soon as its text is available.
+
+        bookmarks: Required. Iterable of Bookmark objects.
+        workers: Optional. Number of concurrent requests, default 8.
+        """
+
+        def fetch(bookmark):
+            bookmark._fetch_html(self.http)
+            bookmark.text
+            return bookmark
+
+        return _imap_bounded(fetch, bookmarks, workers)
+
+    def highlights_for(self, bookmarks, workers=8, refresh=False):
+        """
+        Fetches highlights for many bookmarks over a bounded thread pool,
+        yielding (bookmark, [Highlight]) pairs as each completes. Cached
+        highlights are returned without a request.
+
+        bookmarks: Required. Iterable of Bookmark objects.
+        workers: Optional. Number of concurrent requests, default 8.
+        refresh: Optional. Bypass the highlight cache.
+        """
+        return _imap_bounded(
+            lambda bookmark: (bookmark, bookmark.highlights(refresh)),
+            bookmarks,
+            workers,
+        )
+
+    def delete_highlight(self, highlight_id):
+        """
+        highlight_id: Required. ID of the highlight.
+        """
+        response, data = self.http.request(
+            "/".join([self.urls[_HIGHLIGHTS_], str(highlight_id), "delete"]),
+            method="POST",
+        )
+        if response.get("status") == "200":
+            self.highlight_cache.invalidate(highlight_id=highlight_id)
+            return True
+        return False
+
+    def _memoized(self, name, fetch):
+        """
+        Returns fetch(), reusing a result younger than memo_ttl seconds.
+        """
+        if not self.memo_ttl:
+            return fetch()
+        now = _clock()
+        hit = self._memo.get(name)
+        if hit is not None and now - hit[0] < self.memo_ttl:
+            return hit[1]
+        value = fetch()
+        self._memo[name] = (now, value)
+        return value
 
     def user(self):
+        return dict(self._memoized(_ACCOUNT_, self._user))
+
+    def _user(self):
         response, data = self.http.request(
-            "/".join([_BASE_, _API_VERSION_, _ACCOUNT_]), method="POST", body=None
+            self.urls[_ACCOUNT_], method="POST", body=None
         )
-        user = json.loads(data.decode("utf-8"))[0]
+        user = _loads(data)[0]
         if user.get("type") == "error":
-            raise Exception(data.get("message"))
+            raise Exception(user.get("message"))
         return user
 
     def bookmarks(self, folder="unread", limit=10, have=""):
@@ -421,32 +3032,324 @@ class Instapaper(object):
         folder_id: Optional. Possible values are unread (default),
                    starred, archive, or a folder_id value.
         limit: Optional. A number between 1 and 500, default 25.
+        have: Optional. Comma-separated list of bookmark_id values the
+              client already has, optionally as id:hash:progress:timestamp.
+        """
+        return self._list(folder, limit, have)[0]
+
+    def _list(self, folder, limit, have):
+        """
+        Returns (bookmarks, delete_ids) from a bookmarks/list request.
         """
         response, data = self.http.request(
-            "/".join([_BASE_, _API_VERSION_, _BOOKMARKS_LIST_]),
+            self.urls[_BOOKMARKS_LIST_],
             method="POST",
             body=urlencode({"folder_id": folder, "limit": limit, "have": have}),
         )
-        bookmarks = []
-        items = json.loads(data.decode("utf-8"))
-        for key in items.keys():
-            if key == "error":
-                raise Exception(items[key])
-            elif key == "bookmarks":
-                for bookmark in items[key]:
-                    bookmarks.append(Bookmark(self, bookmark))
-        return bookmarks
+        items = _loads(data)
+        _raise_error(items)
+        bookmarks = [Bookmark(self, record) for record in items.get("bookmarks", ())]
+        delete_ids = _parse_ids(items.get("delete_ids"))
+        if self.store is not None:
+            self.store.put_bookmarks(bookmarks, folder)
+            self.store.delete(delete_ids)
+        if self.search is not None:
+            self.search.put_bookmarks(bookmarks)
+        if self.progress_buffer is not None:
+            self.progress_buffer.reconcile(bookmarks)
+        return bookmarks, delete_ids
+
+    def iter_bookmarks(self, folder="unread", page_size=500, have=()):
+        """
+        Walks an entire folder page by page, feeding the ids already seen
+        back through `have`, and yields Bookmarks lazily as each page is
+        decoded. Only one page is held in memory at a time.
+
+        folder: Optional. unread (default), starred, archive or a folder_id.
+        page_size: Optional. A number between 1 and 500, default 500.
+        have: Optional. Bookmark ids to skip.
+        """
+        seen = [str(bookmark_id) for bookmark_id in have]
+        known = set(seen)
+        while True:
+            response, data = self.http.request(
+                self.urls[_BOOKMARKS_LIST_],
+                method="POST",
+                body=urlencode(
+                    {"folder_id": folder, "limit": page_size, "have": ",".join(seen)}
+                ),
+            )
+            page = (Bookmark(self, record) for record in _records(data, "bookmarks"))
+            if (
+                self.store is not None
+                or self.search is not None
+                or self.progress_buffer is not None
+            ):
+                page = list(page)
+            if self.store is not None:
+                self.store.put_bookmarks(page, folder)
+            if self.search is not None:
+                self.search.put_bookmarks(page)
+            if self.progress_buffer is not None:
+                self.progress_buffer.reconcile(page)
+            count = new = 0
+            for bookmark in page:
+                count += 1
+                bookmark_id = str(bookmark.bookmark_id)
+                if bookmark_id in known:
+                    continue
+                known.add(bookmark_id)
+                seen.append(bookmark_id)
+                new += 1
+                yield bookmark
+            del data, page
+            # a page with nothing new means `have` is being ignored
+            if count < page_size or not new:
+                break
+
+    def import_bookmarks(
+        self,
+        records,
+        folder_id=None,
+        existing=None,
+        workers=8,
+        archive=True,
+        rate=5,
+    ):
+        """
+        Adds many bookmarks concurrently, skipping urls already in the
+        account or earlier in the input (compared by normalize_url). Yields
+        an ImportResult per record as each one completes, with status
+        added, duplicate or failed and, for failures, the error message.
+
+        records: Required. Iterable of urls or dicts with a url and optional
+                 title, description and folder (a title or folder_id), e.g.
+                 from read_import.
+        folder_id: Optional. Folder for records without a folder.
+        existing: Optional. Urls already in the account, by default read
+                  from every folder.
+        workers: Optional. Number of concurrent requests, default 8.
+        archive: Optional. Archive records from an archive folder.
+        rate: Optional. Bookmarks added per second, default 5, or None
+              for no limit beyond the client's RateLimiter.
+        """
+        folder_ids = {}
+        lock = threading.Lock()
+
+        def resolve(name):
+            key = name.strip().lower()
+            if key in ("unread", "starred", "archive", "read archive"):
+                return folder_id
+            with lock:
+                if key not in folder_ids:
+                    folder_ids.update(
+                        (f["title"].lower(), f["folder_id"]) for f in self.folders()
+                    )
+                if key not in folder_ids:
+                    self.create_folder(name.strip())
+                    folder_ids.update(
+                        (f["title"].lower(), f["folder_id"]) for f in self.folders()
+                    )
+            return folder_ids[key]
+
+        bucket = TokenBucket(rate) if rate else None
+
+        def target(folder):
+            if folder is None or folder == "":
+                return folder_id
+            if isinstance(folder, int) or str(folder).isdigit():
+                return folder
+            return resolve(folder)
+
+        def add(item):
+            record, duplicate = item
+            url = record["url"]
+            if duplicate:
+                return ImportResult(url, "duplicate", None, None)
+            bookmark = Bookmark(
+                self,
+                dict(
+                    (name, record[name])
+                    for name in Bookmark.SAVE_FIELDS
+                    if record.get(name)
+                ),
+            )
+            folder = record.get("folder")
+            try:
+                destination = target(folder)
+                if bucket is not None:
+                    wait = bucket.reserve()
+                    if wait > 0:
+                        time.sleep(wait)
+                response, data = bookmark._add(destination)
+                bookmark_id = getattr(bookmark, "bookmark_id", None)
+                if response.get("status") != "200" or bookmark_id is None:
+                    return ImportResult(
+                        url, "failed", None, _error_message(response, data)
+                    )
+                if archive and str(folder).lower() in ("archive", "read archive"):
+                    bookmark.archive()
+                return ImportResult(url, "added", bookmark_id, None)
+            except Exception as e:
+                return ImportResult(url, "failed", None, str(e))
+
+        def dedup():
+            if existing is None:
+                folders = ["unread", "archive"]
+                folders += [f["folder_id"] for f in self.folders()]
+                seen = set(
+                    normalize_url(bookmark.url)
+                    for folder in folders
+                    for bookmark in self.iter_bookmarks(folder)
+                )
+            else:
+                seen = set(normalize_url(url) for url in existing)
+            for record in records:
+                if not isinstance(record, dict):
+                    record = {"url": record}
+                key = normalize_url(record["url"])
+                yield record, key in seen
+                seen.add(key)
+
+        return _imap_bounded(add, dedup(), workers)
+
+    def export(
+        self,
+        path,
+        format="jsonl",
+        text=False,
+        highlights=False,
+        folders=None,
+        checkpoint=None,
+        workers=8,
+        checkpoint_every=500,
+    ):
+        """
+        Streams every folder's bookmarks to a JSONL or columnar file with
+        bounded memory, fetching text and highlights concurrently. Progress
+        is checkpointed, and an interrupted export resumes where the last
+        checkpoint left off. Returns the number of records written.
+
+        path: Required. Output file.
+        format: Optional. jsonl (default) or columnar, see read_columnar.
+        text: Optional. Include each article's text.
+        highlights: Optional. Include each bookmark's highlights.
+        folders: Optional. Folders to export, default unread, archive and
+                 every user folder.
+        checkpoint: Optional. Checkpoint file, default path + ".checkpoint".
+        workers: Optional. Number of concurrent fetches.
+        checkpoint_every: Optional. Records written between checkpoints.
+        """
+        checkpoint = checkpoint or path + ".checkpoint"
+        state = {"done": [], "folder": None, "seen": [], "offset": 0, "count": 0}
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+        if folders is None:
+            folders = ["unread", "archive"] + [f["folder_id"] for f in self.folders()]
+
+        def save():
+            writer.flush()
+            state["offset"] = out.tell()
+            tmp = checkpoint + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.rename(tmp, checkpoint)
+
+        def fetch(bookmark):
+            record = bookmark.to_dict()
+            if text:
+                record["text"] = bookmark.text
+            if highlights:
+                record["highlights"] = [h.to_dict() for h in bookmark.highlights()]
+            return record
+
+        # discard anything written after the last checkpoint
+        out = open(path, "r+b" if state["offset"] else "wb")
+        try:
+            out.truncate(state["offset"])
+            out.seek(state["offset"])
+            writer = EXPORT_FORMATS[format](out)
+            for folder in folders:
+                if str(folder) in state["done"]:
+                    continue
+                if state["folder"] != str(folder):
+                    state["folder"], state["seen"] = str(folder), []
+                bookmarks = self.iter_bookmarks(folder, have=state["seen"])
+                if text or highlights:
+                    records = _imap_bounded(fetch, bookmarks, workers)
+                else:
+                    records = (bookmark.to_dict() for bookmark in bookmarks)
+                for record in records:
+                    record["folder"] = folder
+                    writer.write(record)
+                    state["seen"].append(record["bookmark_id"])
+                    state["count"] += 1
+                    if state["count"] % checkpoint_every == 0:
+                        save()
+                state["done"].append(str(folder))
+                state["folder"], state["seen"] = None, []
+                save()
+        finally:
+            out.close()
+        os.remove(checkpoint)
+        return state["count"]
+
+    def search_bookmarks(self, query, limit=20):
+        """
+        Returns SearchResults for query from the local SearchIndex, without
+        any API request. See SearchIndex.query.
+        """
+        if self.search is None:
+            raise InstapaperException("No search index, pass search=SearchIndex().")
+        return self.search.query(query, limit)
+
+    def sync(self, snapshot, folders=("unread",), limit=500):
+        """
+        Incrementally syncs folders against a SyncSnapshot, sending the
+        snapshot as `have` so only new or changed bookmarks are downloaded.
+        Returns a list of SyncDelta(folder, added, changed, deleted).
+
+        snapshot: Required. SyncSnapshot to build `have` from and update.
+        folders: Optional. Folders to sync, default ("unread",).
+        limit: Optional. Page size, between 1 and 500.
+        """
+        deltas = []
+        for folder in folders:
+            added, changed, deleted = [], [], []
+            while True:
+                bookmarks, delete_ids = self._list(folder, limit, snapshot.have(folder))
+                delta = snapshot.apply(folder, bookmarks, delete_ids)
+                added.extend(delta[0])
+                changed.extend(delta[1])
+                deleted.extend(delta[2])
+                # a full page means there may be more changes waiting
+                if len(bookmarks) < limit or not (delta[0] or delta[1]):
+                    break
+            deltas.append(SyncDelta(folder, added, changed, deleted))
+        if self.search is not None:
+            # a move shows up as a delete in one folder and an add in another
+            kept = set(b.bookmark_id for d in deltas for b in d.added + d.changed)
+            self.search.delete(
+                set(i for d in deltas for i in d.deleted if i not in kept)
+            )
+        if snapshot.path:
+            snapshot.save()
+        return deltas
 
     def folders(self):
+        return list(self._memoized(_FOLDERS_LIST_, self._folders))
+
+    def _folders(self):
         response, data = self.http.request(
-            "/".join([_BASE_, _API_VERSION_, _FOLDERS_LIST_]),
+            self.urls[_FOLDERS_LIST_],
             method="POST",
             body=urlencode({}),
         )
-        folders = []
-        items = json.loads(data.decode("utf-8"))
-        for item in items:
-            folders.append(item)
+        folders = _loads(data)
+        _raise_error(folders)
+        if self.store is not None:
+            self.store.put_folders(folders)
         return folders
 
     def create_folder(self, title):
@@ -454,10 +3357,11 @@ class Instapaper(object):
         title: Required.  Title of the folder.
         """
         response, data = self.http.request(
-            "/".join([_BASE_, _API_VERSION_, _FOLDERS_ADD_]),
+            self.urls[_FOLDERS_ADD_],
             method="POST",
             body=urlencode({"title": title}),
         )
+        self._memo.pop(_FOLDERS_LIST_, None)
         if response.get("status") == "200":
             return True
         raise Exception(response)
@@ -467,10 +3371,494 @@ class Instapaper(object):
         folder_id: Required.  ID of the folder.
         """
         response, data = self.http.request(
-            "/".join([_BASE_, _API_VERSION_, _FOLDERS_DELETE]),
+            self.urls[_FOLDERS_DELETE],
             method="POST",
             body=urlencode({"folder_id": folder_id}),
         )
+        self._memo.pop(_FOLDERS_LIST_, None)
         if response.get("status") == "200":
             return True
         raise Exception(response)
+
+    def _bulk(self, bookmarks, op, args=(), workers=8, progress=None):
+        """
+        Runs one Bookmark operation over many bookmarks concurrently and
+        returns a BatchResult per bookmark. Failures are captured in the
+        results instead of stopping the run.
+        """
+
+        def run(bookmark):
+            try:
+                result = getattr(bookmark, op)(*args)
+                return BatchResult(bookmark, op, args, result, None)
+            except Exception as e:
+                return BatchResult(bookmark, op, args, False, e)
+
+        results = []
+        for result in _imap_bounded(run, bookmarks, workers):
+            results.append(result)
+            if progress is not None:
+                progress(len(results), result)
+        return results
+
+    def archive_folder(self, folder_id, workers=8, progress=None):
+        """
+        Archives every bookmark in a folder concurrently. Returns a list of
+        BatchResult; failed ones have a false result and the error.
+
+        folder_id: Required. unread, starred or a folder_id.
+        workers: Optional. Number of concurrent requests, default 8.
+        progress: Optional. Called with (count, BatchResult) as each
+                  bookmark completes.
+        """
+        bookmarks = list(self.iter_bookmarks(folder_id))
+        return self._bulk(bookmarks, "archive", (), workers, progress)
+
+    def move_all(self, src, dst, predicate=None, workers=8, progress=None):
+        """
+        Moves every bookmark in src to dst concurrently. Returns a list of
+        BatchResult; failed ones have a false result and the error.
+
+        src: Required. unread, starred, archive or a folder_id.
+        dst: Required. A folder_id, or archive or unread, which archive and
+             unarchive instead.
+        predicate: Optional. Only move bookmarks for which it returns True.
+        workers: Optional. Number of concurrent requests, default 8.
+        progress: Optional. Called with (count, BatchResult) as each
+                  bookmark completes.
+        """
+        bookmarks = [
+            bookmark
+            for bookmark in self.iter_bookmarks(src)
+            if predicate is None or predicate(bookmark)
+        ]
+        if str(dst) == "archive":
+            return self._bulk(bookmarks, "archive", (), workers, progress)
+        if str(dst) == "unread":
+            return self._bulk(bookmarks, "unarchive", (), workers, progress)
+        return self._bulk(bookmarks, "move", (dst,), workers, progress)
+
+    def folder_plan(self, spec, folders=None):
+        """
+        Returns the FolderPlan(create, move, delete) that brings the user
+        folders to the layout in spec: titles to create, (bookmark, title)
+        pairs to move and folder ids to delete. Bookmarks already in their
+        declared folder are left alone. Titles match case-insensitively.
+
+        spec: Required. Dict of folder title -> bookmark ids.
+        folders: Optional. Current folders, default from folders().
+        """
+        folders = self.folders() if folders is None else folders
+        titles = dict((title.lower(), title) for title in spec)
+        current = dict((f["title"].lower(), f["folder_id"]) for f in folders)
+        located = {}
+        for folder in folders:
+            for bookmark in self.iter_bookmarks(folder["folder_id"]):
+                located[bookmark.bookmark_id] = (folder["title"].lower(), bookmark)
+        create = [titles[key] for key in titles if key not in current]
+        move = []
+        for title, bookmark_ids in spec.items():
+            for bookmark_id in bookmark_ids:
+                where, bookmark = located.get(int(bookmark_id), (None, None))
+                if where == title.lower():
+                    continue
+                if bookmark is None:
+                    bookmark = Bookmark(self, {"bookmark_id": int(bookmark_id)})
+                move.append((bookmark, title))
+        delete = [current[key] for key in current if key not in titles]
+        return FolderPlan(create, move, delete)
+
+    def mirror_folders(self, spec, workers=8, progress=None):
+        """
+        Creates, moves and deletes just enough to make the user folders match
+        spec, see folder_plan. Folders are created first, then bookmarks are
+        moved concurrently, then folders missing from spec are deleted (the
+        server archives whatever is left in them). Returns a list of
+        BatchResult, with a bookmark of None for folder operations.
+
+        spec: Required. Dict of folder title -> bookmark ids.
+        workers: Optional. Number of concurrent requests, default 8.
+        progress: Optional. Called with (count, BatchResult) as each
+                  operation completes.
+        """
+        folders = self.folders()
+        plan = self.folder_plan(spec, folders)
+        results = []
+
+        def report(result):
+            results.append(result)
+            if progress is not None:
+                progress(len(results), result)
+
+        def folder_op(op, arg):
+            try:
+                report(BatchResult(None, op, (arg,), getattr(self, op)(arg), None))
+            except Exception as e:
+                report(BatchResult(None, op, (arg,), False, e))
+
+        for title in plan.create:
+            folder_op("create_folder", title)
+        if plan.create:
+            folders = self.folders()
+        folder_ids = dict((f["title"].lower(), f["folder_id"]) for f in folders)
+
+        def move(item):
+            bookmark, title = item
+            folder_id = folder_ids.get(title.lower())
+            try:
+                if folder_id is None:
+                    raise InstapaperException("No folder {}.".format(title))
+                result = bookmark.move(folder_id)
+                return BatchResult(bookmark, "move", (folder_id,), result, None)
+            except Exception as e:
+                return BatchResult(bookmark, "move", (folder_id,), False, e)
+
+        for result in _imap_bounded(move, plan.move, workers):
+            report(result)
+        for folder_id in plan.delete:
+            folder_op("delete_folder", folder_id)
+        return results
+
+
+class FairScheduler(object):
+    """
+    Grants request slots round-robin across users: while several users have
+    requests waiting, each gets one slot in turn, so a user with a deep
+    backlog cannot starve the others. At most `concurrency` slots are held
+    at once, and grants are paced by an optional global TokenBucket.
+
+    concurrency: Required. Maximum number of requests in flight.
+    rate: Optional. Global requests per second, or a tuple of (rate, burst).
+    """
+
+    def __init__(self, concurrency, rate=None):
+        self.concurrency = concurrency
+        if rate is not None and not isinstance(rate, tuple):
+            rate = (rate,)
+        self.bucket = TokenBucket(*rate) if rate else None
+        self.active = 0
+        self.__cond = threading.Condition()
+        self.__ready = deque()
+        self.__waiting = {}
+
+    def waiting(self):
+        with self.__cond:
+            return sum(self.__waiting.values())
+
+    def acquire(self, user):
+        """
+        Blocks until user is granted a slot. Must be paired with release().
+        """
+        with self.__cond:
+            waiting = self.__waiting
+            waiting[user] = waiting.get(user, 0) + 1
+            if waiting[user] == 1:
+                self.__ready.append(user)
+            while self.active >= self.concurrency or self.__ready[0] != user:
+                self.__cond.wait()
+            self.__ready.popleft()
+            waiting[user] -= 1
+            if waiting[user]:
+                self.__ready.append(user)
+            else:
+                del waiting[user]
+            self.active += 1
+            self.__cond.notify_all()
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+    def release(self):
+        with self.__cond:
+            self.active -= 1
+            self.__cond.notify_all()
+
+
+class _FairPool(object):
+    """
+    ConnectionPool front end for one InstapaperPool session: applies the
+    user's rate budget, then waits for a fair slot on the shared pool.
+    """
+
+    def __init__(self, owner, key, bucket):
+        self.owner = owner
+        self.key = key
+        self.bucket = bucket
+
+    def request(self, method, path, body=None, headers=None):
+        owner = self.owner
+        owner._touch(self.key)
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+        owner.scheduler.acquire(self.key)
+        try:
+            return owner.connections.request(method, path, body, headers)
+        finally:
+            owner.scheduler.release()
+
+
+class InstapaperPool(object):
+    """
+    Manages many user sessions under one consumer. Sessions share one
+    ConnectionPool, RateLimiter and Metrics; requests are scheduled
+    round-robin across users under a global and a per-user rate budget.
+    Tokens are kept for every user, but idle sessions (the client objects
+    and their caches) are evicted and rebuilt on next use.
+
+        >>> pool = InstapaperPool(key, secret, pool_size=50, rate=20, user_rate=2)
+        >>> pool.add("alice", oauth_token, oauth_token_secret)
+        >>> pool["alice"].bookmarks()
+
+    pool_size: Optional. Shared keep-alive connections and maximum requests
+               in flight, default 20.
+    rate: Optional. Global requests per second, or a tuple of (rate, burst).
+    user_rate: Optional. Requests per second per user, or (rate, burst).
+    idle_timeout: Optional. Seconds before an unused session is evicted.
+    max_sessions: Optional. Maximum live sessions, least recently used
+                  sessions are evicted first.
+    limiter: Optional. RateLimiter shared by all sessions.
+    """
+
+    def __init__(
+        self,
+        oauthkey,
+        oauthsec,
+        pool_size=20,
+        rate=None,
+        user_rate=None,
+        idle_timeout=300,
+        max_sessions=None,
+        limiter=None,
+        metrics=None,
+        base=_BASE_,
+    ):
+        if not oauthkey or not oauthsec:
+            raise InstapaperAuthenticationException(
+                "No OAuth key or secret found. Please provide both."
+            )
+        self.oauthkey = oauthkey
+        self.oauthsec = oauthsec
+        self._consumer = None
+        self.base = base
+        self.connections = ConnectionPool(base, pool_size)
+        self.scheduler = FairScheduler(pool_size, rate)
+        self.limiter = limiter or RateLimiter()
+        self.metrics = metrics or Metrics()
+        if user_rate is not None and not isinstance(user_rate, tuple):
+            user_rate = (user_rate,)
+        self.user_rate = user_rate
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.tokens = {}
+        self.evictions = 0
+        self.__sessions = OrderedDict()
+        self.__used = {}
+        self.__lock = threading.Lock()
+        self.__swept = _clock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, key):
+        return key in self.tokens
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def add(self, key, oauth_token, oauth_token_secret):
+        """
+        Registers a user's token and returns their session.
+
+        key: Required. Any hashable id for the user.
+        """
+        with self.__lock:
+            self.tokens[key] = (oauth_token, oauth_token_secret)
+            self.__sessions.pop(key, None)
+        return self.get(key)
+
+    def login(self, key, username, password):
+        """
+        Logs a user in with xAuth and returns their session.
+        """
+        client = self._client(key)
+        client.login(username, password)
+        return self.add(key, client.token.key, client.token.secret)
+
+    def remove(self, key):
+        with self.__lock:
+            self.tokens.pop(key, None)
+            self.__sessions.pop(key, None)
+            self.__used.pop(key, None)
+
+    def get(self, key):
+        """
+        Returns the Instapaper session for a registered user, rebuilding it
+        if it was evicted.
+        """
+        self.evict_idle()
+        with self.__lock:
+            client = self.__sessions.get(key)
+            if client is None:
+                if key not in self.tokens:
+                    raise KeyError(key)
+                client = self._client(key)
+                client.login_with_token(*self.tokens[key])
+                self.__sessions[key] = client
+            self.__sessions[key] = self.__sessions.pop(key)
+            self.__used[key] = _clock()
+            while self.max_sessions and len(self.__sessions) > self.max_sessions:
+                self.__evict(next(iter(self.__sessions)))
+        return client
+
+    def _client(self, key):
+        bucket = TokenBucket(*self.user_rate) if self.user_rate else None
+        pool = _FairPool(self, key, bucket)
+        return Instapaper(
+            self.oauthkey,
+            self.oauthsec,
+            pool=self.connections,
+            limiter=self.limiter,
+            metrics=self.metrics,
+            base=self.base,
+            transport=lambda signer: HTTPTransport(
+                signer, pool, self.limiter, self.metrics
+            ),
+        )
+
+    def _touch(self, key):
+        self.__used[key] = _clock()
+
+    def __evict(self, key):
+        self.__sessions.pop(key, None)
+        self.evictions += 1
+
+    def evict_idle(self, force=False):
+        """
+        Evicts sessions unused for idle_timeout seconds. Runs at most once
+        per tenth of idle_timeout unless forced. Returns the number evicted.
+        """
+        now = _clock()
+        if not self.idle_timeout:
+            return 0
+        if not force and now - self.__swept < self.idle_timeout / 10.0:
+            return 0
+        with self.__lock:
+            self.__swept = now
+            idle = [
+                key
+                for key in self.__sessions
+                if now - self.__used.get(key, 0) >= self.idle_timeout
+            ]
+            for key in idle:
+                self.__evict(key)
+        return len(idle)
+
+    def sessions(self):
+        """
+        Returns the keys of the live sessions, least recently used first.
+        """
+        with self.__lock:
+            return list(self.__sessions)
+
+    def stats(self):
+        return {
+            "users": len(self.tokens),
+            "sessions": len(self.__sessions),
+            "evictions": self.evictions,
+            "active": self.scheduler.active,
+            "waiting": self.scheduler.waiting(),
+        }
+
+    def close(self):
+        with self.__lock:
+            self.__sessions.clear()
+        self.connections.close()
+
+
+def _credentials(args):
+    """
+    Returns (key, secret, username, password) from the command line, the
+    environment or ~/.netrc (machines api.instapaper.com and instapaper.com).
+    """
+    key = args.key or os.getenv("INSTAPAPER_KEY")
+    secret = args.secret or os.getenv("INSTAPAPER_SECRET")
+    username = args.username or os.getenv("INSTAPAPER_USERNAME")
+    password = args.password or os.getenv("INSTAPAPER_PASSWORD")
+    if not (key and secret and username and password):
+        try:
+            secrets = netrc.netrc()
+        except (IOError, netrc.NetrcParseError):
+            secrets = None
+        if secrets is not None:
+            if not (key and secret) and secrets.authenticators("api.instapaper.com"):
+                key, __, secret = secrets.authenticators("api.instapaper.com")
+            if not (username and password) and secrets.authenticators("instapaper.com"):
+                username, __, password = secrets.authenticators("instapaper.com")
+    return key, secret, username, password
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="instapaper", description=__doc__.strip())
+    parser.add_argument("--key", help="OAuth consumer key")
+    parser.add_argument("--secret", help="OAuth consumer secret")
+    parser.add_argument("--username", help="Instapaper username")
+    parser.add_argument("--password", help="Instapaper password")
+    commands = parser.add_subparsers(dest="command")
+    export = commands.add_parser("export", help="export bookmarks to a file")
+    export.add_argument("path", help="output file")
+    export.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="jsonl")
+    export.add_argument("--text", action="store_true", help="include article text")
+    export.add_argument("--highlights", action="store_true", help="include highlights")
+    export.add_argument(
+        "--folder", action="append", dest="folders", help="folder to export"
+    )
+    export.add_argument("--checkpoint", help="checkpoint file")
+    export.add_argument("--workers", type=int, default=8)
+    imports = commands.add_parser("import", help="import bookmarks from a file")
+    imports.add_argument("path", help="csv, jsonl or bookmark html file")
+    imports.add_argument("--format", choices=sorted(IMPORT_FORMATS))
+    imports.add_argument("--folder-id", help="folder for records without one")
+    imports.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    key, secret, username, password = _credentials(args)
+    client = Instapaper(key, secret, credentials=CredentialCache())
+    client.login(username, password)
+    if args.command == "export":
+        count = client.export(
+            args.path,
+            format=args.format,
+            text=args.text,
+            highlights=args.highlights,
+            folders=args.folders,
+            checkpoint=args.checkpoint,
+            workers=args.workers,
+        )
+        sys.stderr.write("exported {} bookmarks to {}\n".format(count, args.path))
+    elif args.command == "import":
+        counts = {"added": 0, "duplicate": 0, "failed": 0}
+        for result in client.import_bookmarks(
+            read_import(args.path, args.format),
+            folder_id=args.folder_id,
+            workers=args.workers,
+        ):
+            counts[result.status] += 1
+            if result.status == "failed":
+                sys.stderr.write("failed {}: {}\n".format(result.url, result.error))
+        sys.stderr.write(
+            "added {added}, skipped {duplicate} duplicates, {failed} failed\n".format(
+                **counts
+            )
+        )
+        return 1 if counts["failed"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------------------------------
+# Copyright (c) 2013-2025, Ryan Galloway (ryan@rsgalloway.com)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# - Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# - Neither the name of the software nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# ---------------------------------------------------------------------------------------------
+# docs and latest version available for download at
+# http://github.com/rsgalloway/instapaper
+# ---------------------------------------------------------------------------------------------
+
+__doc__ = """
+Native asyncio client for the Instapaper API, mirroring the Instapaper and
+Bookmark classes. Requests are signed with OAuth 1.0a directly and sent
+over a pooled keep-alive HTTP/1.1 transport, so many operations can be in
+flight on one event loop.
+
+    >>> client = AsyncInstapaper(INSTAPAPER_KEY, INSTAPAPER_SECRET)
+    >>> await client.login(email_address, password)
+    >>> marks = await client.bookmarks()
+    >>> await marks[0].star()
+"""
+
+import asyncio
+import ssl
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import instapaper
+from instapaper import (
+    _ACCESS_TOKEN_,
+    _ACCOUNT_,
+    _API_VERSION_,
+    _BASE_,
+    _BOOKMARKS_ADD_,
+    _BOOKMARKS_ARCHIVE_,
+    _BOOKMARKS_DELETE_,
+    _BOOKMARKS_LIST_,
+    _BOOKMARKS_MOVE_,
+    _BOOKMARKS_STAR_,
+    _BOOKMARKS_TEXT_,
+    _BOOKMARKS_UNARCHIVE_,
+    _BOOKMARKS_UNSTAR_,
+    _FOLDERS_ADD_,
+    _FOLDERS_DELETE,
+    _FOLDERS_LIST_,
+    _HIGHLIGHTS_,
+    InstapaperAuthenticationException,
+    OAuthSigner,
+    _Response,
+    dehtml,
+)
+
+
+class _ConnectionPool(object):
+    """
+    Pool of keep-alive HTTP/1.1 connections to a single host.
+
+    base: Required. Base url, e.g. https://www.instapaper.com
+    size: Optional. Maximum number of concurrent connections.
+    timeout: Optional. Seconds allowed to connect, and to send a request
+             and read its response, default 30.
+    """
+
+    def __init__(self, base, size=10, timeout=30):
+        parts = urlsplit(base)
+        self.host = parts.hostname
+        self.secure = parts.scheme == "https"
+        self.port = parts.port or (443 if self.secure else 80)
+        self.netloc = parts.netloc
+        self.size = size
+        self.timeout = timeout
+        self._ssl = ssl.create_default_context() if self.secure else None
+        self._idle = []
+        self._semaphore = None
+
+    async def _connect(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host,
+                self.port,
+                ssl=self._ssl,
+                server_hostname=self.host if self.secure else None,
+            ),
+            self.timeout,
+        )
+
+    async def request(self, method, path, body=b"", headers=None):
+        """
+        Sends a request, returning (response, content).
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        async with self._semaphore:
+            reused = bool(self._idle)
+            conn = self._idle.pop() if reused else await self._connect()
+            try:
+                response, content, keep_alive = await self._exchange(
+                    conn, method, path, body, headers
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # idle connection was closed by the server, retry on a new one
+                conn = await self._connect()
+                response, content, keep_alive = await self._exchange(
+                    conn, method, path, body, headers
+                )
+            if keep_alive:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+            return response, content
+
+    async def _exchange(self, conn, method, path, body, headers):
+        """
+        Sends a request and reads its response within the timeout. The
+        connection is closed on any error, timeout or cancellation, since
+        it may be left mid-response.
+        """
+        try:
+            return await asyncio.wait_for(
+                self._send(conn, method, path, body, headers), self.timeout
+            )
+        except BaseException:
+            conn[1].close()
+            raise
+
+    async def _send(self, conn, method, path, body, headers):
+        reader, writer = conn
+        lines = [
+            "{} {} HTTP/1.1".format(method, path),
+            "Host: {}".format(self.netloc),
+            "Content-Length: {}".format(len(body)),
+        ]
+        lines.extend("{}: {}".format(k, v) for k, v in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status = int((await reader.readuntil(b"\r\n")).split()[1])
+        headers = []
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers.append((key.strip(), value.strip()))
+        response = _Response(status, headers)
+
+        if response.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            content = b"".join(chunks)
+        elif "content-length" in response:
+            content = await reader.readexactly(int(response["content-length"]))
+        else:
+            content = await reader.read()
+            return response, content, False
+        return response, content, response.get("connection", "").lower() != "close"
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class AsyncBookmark(instapaper.Bookmark):
+    """
+    Bookmark whose API methods are coroutines. `html` and `text` are
+    awaitable properties:
+
+        >>> html = await bookmark.html
+    """
+
+    __slots__ = ("_html", "_text")
+
+    def __init__(self, parent, params):
+        instapaper.Bookmark.__init__(self, parent, params)
+        self._html = None
+        self._text = None
+
+    def _sync_only(self, *args, **kwargs):
+        raise instapaper.InstapaperException(
+            "Not available on AsyncBookmark, use its coroutine methods."
+        )
+
+    # these send requests through the blocking Instapaper.http
+    _add = _fetch_html = _update_progress = _sync_only
+
+    async def _post(self, endpoint, params=None):
+        return await self.parent._post(endpoint, params)
+
+    async def _bookmark_post(self, endpoint):
+        response, data = await self._post(endpoint, {"bookmark_id": self.bookmark_id})
+        return response.get("status") == "200"
+
+    @property
+    def html(self):
+        return self._get_html()
+
+    async def _get_html(self):
+        if self._html is None:
+            response, html = await self._post(
+                _BOOKMARKS_TEXT_, {"bookmark_id": self.bookmark_id}
+            )
+            if response.get("status") == "200":
+                self._html = html.decode("utf-8")
+        return self._html
+
+    @property
+    def text(self):
+        return self._get_text()
+
+    async def _get_text(self):
+        if self._text is None:
+            self._text = dehtml(await self._get_html())
+        return self._text
+
+    async def star(self):
+        if await self._bookmark_post(_BOOKMARKS_STAR_):
+            self.starred = True
+            return True
+        return False
+
+    async def unstar(self):
+        if await self._bookmark_post(_BOOKMARKS_UNSTAR_):
+            self.starred = False
+            return True
+        return False
+
+    async def archive(self):
+        return await self._bookmark_post(_BOOKMARKS_ARCHIVE_)
+
+    async def unarchive(self):
+        return await self._bookmark_post(_BOOKMARKS_UNARCHIVE_)
+
+    async def delete(self):
+        return await self._bookmark_post(_BOOKMARKS_DELETE_)
+
+    async def save(self, folder_id=None):
+        params = {}
+        for name in (
+            "content",
+            "is_private_from_source",
+            "url",
+            "title",
+            "description",
+        ):
+            if getattr(self, name, None):
+                params[name] = getattr(self, name)
+        if folder_id:
+            params["folder_id"] = folder_id
+        response, data = await self._post(_BOOKMARKS_ADD_, params)
+        if response.get("status") == "200":
+            self._html = data
+        return self._html
+
+    async def move(self, folder_id):
+        response, data = await self._post(
+            _BOOKMARKS_MOVE_, {"bookmark_id": self.bookmark_id, "folder_id": folder_id}
+        )
+        return response.get("status") == "200"
+
+    async def get_highlights(self):
+        response, data = await self._post(
+            "bookmarks/{}/highlights".format(self.bookmark_id)
+        )
+        if response.get("status") == "200":
+            return data.decode()
+        raise Exception(response)
+
+    async def highlights(self, refresh=False):
+        """
+        Returns the bookmark's highlights as a list of Highlight objects,
+        from the client's highlight cache when possible.
+
+        refresh: Optional. Bypass the cache.
+        """
+        cache = self.parent.highlight_cache
+        highlights = None if refresh else cache.get(self.bookmark_id)
+        if highlights is None:
+            highlights = [
+                instapaper.Highlight(self.parent, record)
+                for record in instapaper._loads(await self.get_highlights())
+                if record.get("type", "highlight") == "highlight"
+            ]
+            cache.put(self.bookmark_id, highlights)
+        return highlights
+
+    async def create_highlight(self, highlight_text, position=0):
+        """
+        highlight_text: Required. The text for the highlight
+        position: Optional. The 0-indexed position of text in the content. Defaults to 0.
+        """
+        response, data = await self._post(
+            "bookmarks/{}/highlight".format(self.bookmark_id),
+            {"text": highlight_text, "position": position},
+        )
+        if response.get("status") == "200":
+            self.parent.highlight_cache.invalidate(bookmark_id=self.bookmark_id)
+            return data.decode()
+        raise Exception(response)
+
+    async def delete_highlight(self, highlight_id):
+        """
+        highlight_id: Required. ID of the highlight.
+        """
+        return await self.parent.delete_highlight(highlight_id)
+
+
+class AsyncInstapaper(object):
+    """
+    asyncio counterpart of instapaper.Instapaper.
+
+    oauthkey, oauthsec: Required. Application credentials.
+    base: Optional. Base url, e.g. a local stand-in server.
+    pool_size: Optional. Maximum number of concurrent connections.
+    timeout: Optional. Seconds allowed per connect and per request.
+    """
+
+    def __init__(self, oauthkey, oauthsec, base=_BASE_, pool_size=10, timeout=30):
+        if not oauthkey or not oauthsec:
+            raise InstapaperAuthenticationException(
+                "No OAuth key or secret found. Please provide both."
+            )
+        self.oauthkey = oauthkey
+        self.oauthsec = oauthsec
+        self.base = base.rstrip("/")
+        self.pool = _ConnectionPool(self.base, pool_size, timeout)
+        self.signer = OAuthSigner(oauthkey, oauthsec)
+        self.token = None
+        self.highlight_cache = instapaper.HighlightCache()
+
+    async def _post(self, endpoint, params=None):
+        uri = "/".join([self.base, _API_VERSION_, endpoint])
+        params = dict((k, str(v)) for k, v in (params or {}).items())
+        headers = {
+            "Authorization": self.signer.authorization("POST", uri, params),
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        return await self.pool.request(
+            "POST", urlsplit(uri).path, urlencode(params).encode("utf-8"), headers
+        )
+
+    async def login(self, username, password):
+        response, content = await self._post(
+            _ACCESS_TOKEN_,
+            {
+                "x_auth_mode": "client_auth",
+                "x_auth_username": username,
+                "x_auth_password": password,
+            },
+        )
+        if response.status in (401, 403):
+            raise InstapaperAuthenticationException(
+                "User could not be authenticated. Please check that user and OAuth credentials are correct."
+            )
+        _oauth = dict(parse_qsl(content.decode("utf-8")))
+        self.login_with_token(_oauth["oauth_token"], _oauth["oauth_token_secret"])
+
+    def login_with_token(self, oauth_token, oauth_token_secret):
+        """
+        When you want to access a user's data using their existing token
+        """
+        self.token = oauth_token
+        self.signer = OAuthSigner(
+            self.oauthkey, self.oauthsec, oauth_token, oauth_token_secret
+        )
+
+    async def user(self):
+        response, data = await self._post(_ACCOUNT_)
+        user = instapaper._loads(data)[0]
+        if user.get("type") == "error":
+            raise Exception(user.get("message"))
+        return user
+
+    async def bookmarks(self, folder="unread", limit=10, have=""):
+        """
+        folder_id: Optional. Possible values are unread (default),
+                   starred, archive, or a folder_id value.
+        limit: Optional. A number between 1 and 500, default 25.
+        """
+        response, data = await self._post(
+            _BOOKMARKS_LIST_, {"folder_id": folder, "limit": limit, "have": have}
+        )
+        items = instapaper._loads(data)
+        instapaper._raise_error(items)
+        return [
+            AsyncBookmark(self, bookmark) for bookmark in items.get("bookmarks", [])
+        ]
+
+    async def delete_highlight(self, highlight_id):
+        """
+        highlight_id: Required. ID of the highlight.
+        """
+        response, data = await self._post(
+            "{}/{}/delete".format(_HIGHLIGHTS_, highlight_id)
+        )
+        if response.get("status") == "200":
+            self.highlight_cache.invalidate(highlight_id=highlight_id)
+            return True
+        return False
+
+    async def folders(self):
+        response, data = await self._post(_FOLDERS_LIST_)
+        folders = instapaper._loads(data)
+        instapaper._raise_error(folders)
+        return folders
+
+    async def create_folder(self, title):
+        """
+        title: Required.  Title of the folder.
+        """
+        response, data = await self._post(_FOLDERS_ADD_, {"title": title})
+        if response.get("status") == "200":
+            return True
+        raise Exception(response)
+
+    async def delete_folder(self, folder_id):
+        """
+        folder_id: Required.  ID of the folder.
+        """
+        response, data = await self._post(_FOLDERS_DELETE, {"folder_id": folder_id})
+        if response.get("status") == "200":
+            return True
+        raise Exception(response)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------------------------------
+# Copyright (c) 2013-2025, Ryan Galloway (ryan@rsgalloway.com)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# - Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# - Neither the name of the software nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# ---------------------------------------------------------------------------------------------
+# docs and latest version available for download at
+# http://github.com/rsgalloway/instapaper
+# ---------
+
+"""
+Local stand-in for the Instapaper API, for offline tests and benchmarks.
+Implements the xAuth login flow (verifying OAuth signatures) and the
+account, bookmarks, folders and highlights endpoints on an in-memory
+account per user, with configurable latency and error injection.
+
+    >>> with MockInstapaper(bookmarks=1000, latency=0.01) as server:
+    ...     i = instapaper.Instapaper("key", "secret", base=server.base)
+    ...     i.login("user", "pass")
+
+Or standalone:
+
+    $ python mock_instapaper.py --port 8080 --bookmarks 1000
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote
+
+import instapaper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _article():
+    paths = sorted(glob.glob(os.path.join(FIXTURES, "articles", "*.html")))
+    if paths:
+        with open(paths[len(paths) // 2]) as f:
+            return f.read()
+    return "".join("<p>Paragraph {} of the article.</p>".format(i) for i in range(50))
+
+
+class MockError(Exception):
+    """
+    Raised by endpoint handlers to answer with an API error.
+    """
+
+    def __init__(self, code, message, status=400):
+        Exception.__init__(self, message)
+        self.code = code
+        self.status = status
+
+
+class Account(object):
+    """
+    One user's bookmarks, folders and highlights.
+    """
+
+    def __init__(self, user_id, username, bookmarks, rand):
+        self.user = {"type": "user", "user_id": user_id, "username": username}
+        self.bookmarks = OrderedDict()
+        self.folders = OrderedDict()
+        self.highlights = OrderedDict()
+        self.rand = rand
+        self.next_id = 1000
+        now = int(time.time())
+        for i in range(bookmarks):
+            self.add_bookmark(
+                "https://example.com/articles/{}".format(i),
+                "Article {}".format(i),
+                "Description of article {}".format(i),
+                timestamp=now - bookmarks + i,
+            )
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def add_bookmark(
+        self, url, title="", description="", folder="unread", timestamp=None
+    ):
+        for bookmark in self.bookmarks.values():
+            if bookmark["url"] == url:
+                return bookmark
+        bookmark = {
+            "type": "bookmark",
+            "bookmark_id": self.new_id(),
+            "url": url,
+            "title": title or url,
+            "description": description,
+            "hash": "%08x" % self.rand.getrandbits(32),
+            "time": timestamp or int(time.time()),
+            "progress": 0.0,
+            "progress_timestamp": 0,
+            "starred": "0",
+            "private_source": "",
+            "folder": folder,
+        }
+        self.bookmarks[bookmark["bookmark_id"]] = bookmark
+        return bookmark
+
+    def bookmark(self, bookmark_id):
+        try:
+            return self.bookmarks[int(bookmark_id)]
+        except (KeyError, TypeError, ValueError):
+            raise MockError(1241, "Invalid or missing bookmark_id")
+
+    def folder(self, folder_id):
+        if str(folder_id) in ("unread", "archive"):
+            return str(folder_id)
+        try:
+            return self.folders[int(folder_id)]["folder_id"]
+        except (KeyError, TypeError, ValueError):
+            raise MockError(1242, "Invalid or missing folder_id")
+
+
+def _public(bookmark):
+    return dict((k, v) for k, v in bookmark.items() if k != "folder")
+
+
+class MockInstapaper(object):
+    """
+    Threaded HTTP/1.1 server speaking the Instapaper API.
+
+    consumer_key, consumer_secret: Optional. Accepted application credentials.
+    users: Optional. Dict of username -> password.
+    bookmarks: Optional. Number of bookmarks each account starts with.
+    latency: Optional. Seconds added to every response.
+    error_rate: Optional. Fraction of requests answered with error_status.
+    error_status: Optional. Status of injected errors, default 503.
+    article: Optional. Html returned by bookmarks/get_text.
+    host, port: Optional. Address to listen on, default an ephemeral port.
+    seed: Optional. Seed for hashes and error injection.
+    """
+
+    def __init__(
+        self,
+        consumer_key="key",
+        consumer_secret="secret",
+        users=None,
+        bookmarks=100,
+        latency=0.0,
+        error_rate=0.0,
+        error_status=503,
+        article=None,
+        host="127.0.0.1",
+        port=0,
+        seed=0,
+    ):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.users = users or {"user": "pass"}
+        self.initial_bookmarks = bookmarks
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.article = article if article is not None else _article()
+        self.rand = random.Random(seed)
+        self.requests = {}
+        self.accounts = {}
+        self.tokens = {}
+        self.failures = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.base = "http://{}:{}".format(*self.server.server_address[:2])
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail(self, endpoint, status, count=1):
+        """
+        Answers the next count requests to endpoint (e.g. bookmarks/star)
+        with status.
+        """
+        with self.lock:
+            self.failures.extend([(endpoint, status)] * count)
+
+    def account(self, username):
+        with self.lock:
+            if username not in self.accounts:
+                self.accounts[username] = Account(
+                    len(self.accounts) + 1,
+                    username,
+                    self.initial_bookmarks,
+                    random.Random(self.rand.random()),
+                )
+            return self.accounts[username]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes; without this,
+            # Nagle and delayed ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                status, headers, content = server.handle(
+                    self.command, self.path, self.headers, body
+                )
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST
+
+        return Handler
+
+    def handle(self, method, path, headers, body):
+        """
+        Returns (status, headers, content) for a request.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        endpoint = path.split("?", 1)[0].strip("/")
+        api = "/" + instapaper._API_VERSION_ + "/"
+        if api.strip("/") in endpoint:
+            endpoint = endpoint.split(api.strip("/"), 1)[1].strip("/")
+        name = instapaper.Metrics.endpoint(endpoint)
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            forced = None
+            for i, (failing, status) in enumerate(self.failures):
+                if failing == name:
+                    forced = self.failures.pop(i)[1]
+                    break
+            injected = self.error_rate and self.rand.random() < self.error_rate
+        if forced or injected:
+            return forced or self.error_status, {"Retry-After": "0"}, b""
+        params = dict(parse_qsl(body, keep_blank_values=True))
+        try:
+            username = self._authenticate(method, path, headers, params, endpoint)
+            if endpoint == "oauth/access_token":
+                return self._login(params)
+            result = self._dispatch(self.account(username), endpoint, params)
+        except MockError as e:
+            error = [{"type": "error", "error_code": e.code, "message": str(e)}]
+            return e.status, {}, json.dumps(error).encode("utf-8")
+        if isinstance(result, str):
+            return 200, {"Content-Type": "text/html"}, result.encode("utf-8")
+        return 200, {}, json.dumps(result).encode("utf-8")
+
+    def _authenticate(self, method, path, headers, params, endpoint):
+        """
+        Verifies the OAuth signature and returns the token's username.
+        """
+        header = headers.get("Authorization") or ""
+        if not header.startswith("OAuth "):
+            raise MockError(401, "Missing OAuth header", 401)
+        oauth = {}
+        for pair in header[6:].split(","):
+            key, __, value = pair.strip().partition("=")
+            oauth[key] = unquote(value.strip('"'))
+        if oauth.get("oauth_consumer_key") != self.consumer_key:
+            raise MockError(401, "Invalid consumer key", 401)
+        token = oauth.get("oauth_token")
+        username = None
+        token_secret = None
+        if endpoint != "oauth/access_token":
+            with self.lock:
+                if token not in self.tokens:
+                    raise MockError(403, "Invalid or expired token", 401)
+                token_secret, username = self.tokens[token]
+        signer = instapaper.OAuthSigner(
+            self.consumer_key, self.consumer_secret, token, token_secret
+        )
+        expected = signer.authorization(
+            method,
+            "http://" + headers["Host"] + path,
+            params,
+            oauth.get("oauth_nonce"),
+            oauth.get("oauth_timestamp"),
+        )
+        if (
+            'oauth_signature="{}"'.format(
+                instapaper._quote(oauth.get("oauth_signature", ""))
+            )
+            not in expected
+        ):
+            raise MockError(401, "Invalid signature", 401)
+        return username
+
+    def revoke(self, username):
+        """
+        Invalidates every token issued to username.
+        """
+        with self.lock:
+            for token, (secret, owner) in list(self.tokens.items()):
+                if owner == username:
+                    del self.tokens[token]
+
+    def _login(self, params):
+        username = params.get("x_auth_username")
+        if params.get("x_auth_mode") != "client_auth" or self.users.get(
+            username
+        ) != params.get("x_auth_password"):
+            raise MockError(401, "Invalid username or password", 401)
+        with self.lock:
+            token = "%016x" % self.rand.getrandbits(64)
+            secret = "%016x" % self.rand.getrandbits(64)
+            self.tokens[token] = (secret, username)
+        content = "oauth_token={}&oauth_token_secret={}".format(token, secret)
+        return 200, {}, content.encode("utf-8")
+
+    def _dispatch(self, account, endpoint, params):
+        with self.lock:
+            if endpoint == "account/verify_credentials":
+                return [account.user]
+            if endpoint == "bookmarks/list":
+                return self._list(account, params)
+            if endpoint == "bookmarks/get_text":
+                account.bookmark(params.get("bookmark_id"))
+                return self.article
+            if endpoint == "bookmarks/add":
+                if not params.get("url"):
+                    raise MockError(1240, "Invalid URL specified")
+                folder = account.folder(params.get("folder_id") or "unread")
+                bookmark = account.add_bookmark(
+                    params["url"],
+                    params.get("title", ""),
+                    params.get("description", ""),
+                    folder,
+                )
+                return [_public(bookmark)]
+            if endpoint.startswith("bookmarks/") and endpoint.count("/") == 1:
+                return self._mutate(account, endpoint.split("/")[1], params)
+            if endpoint == "folders/list":
+                return list(account.folders.values())
+            if endpoint == "folders/add":
+                title = params.get("title")
+                if any(f["title"] == title for f in account.folders.values()):
+                    raise MockError(1251, "User already has a folder with this title")
+                folder = {
+                    "type": "folder",
+                    "folder_id": account.new_id(),
+                    "title": title,
+                    "sync_to_mobile": 1,
+                    "position": len(account.folders) + 1,
+                }
+                account.folders[folder["folder_id"]] = folder
+                return [folder]
+            if endpoint == "folders/delete":
+                folder_id = account.folder(params.get("folder_id"))
+                del account.folders[folder_id]
+                for bookmark in account.bookmarks.values():
+                    if bookmark["folder"] == folder_id:
+                        bookmark["folder"] = "archive"
+                return []
+            parts = endpoint.split("/")
+            if parts[0] == "bookmarks" and parts[-1] == "highlights":
+                bookmark_id = account.bookmark(parts[1])["bookmark_id"]
+                return [
+                    h
+                    for h in account.highlights.values()
+                    if h["bookmark_id"] == bookmark_id
+                ]
+            if parts[0] == "bookmarks" and parts[-1] == "highlight":
+                highlight = {
+                    "type": "highlight",
+                    "highlight_id": account.new_id(),
+                    "bookmark_id": account.bookmark(parts[1])["bookmark_id"],
+                    "text": params.get("text", ""),
+                    "note": None,
+                    "time": int(time.time()),
+                    "position": int(params.get("position") or 0),
+                }
+                account.highlights[highlight["highlight_id"]] = highlight
+                return [highlight]
+            if parts[0] == "highlights" and parts[-1] == "delete":
+                if account.highlights.pop(int(parts[1]), None) is None:
+                    raise MockError(1600, "Invalid highlight_id")
+                return []
+        raise MockError(404, "Unknown endpoint " + endpoint, 404)
+
+    def _list(self, account, params):
+        folder = params.get("folder_id") or "unread"
+        limit = min(500, max(1, int(params.get("limit") or 25)))
+        have = set()
+        for item in (params.get("have") or "").split(","):
+            if item.strip():
+                have.add(int(item.split(":")[0]))
+        if folder == "starred":
+            matches = [b for b in account.bookmarks.values() if b["starred"] == "1"]
+        else:
+            folder = account.folder(folder)
+            matches = [b for b in account.bookmarks.values() if b["folder"] == folder]
+        ids = set(b["bookmark_id"] for b in matches)
+        bookmarks = [
+            _public(b) for b in reversed(matches) if b["bookmark_id"] not in have
+        ][:limit]
+        shown = set(b["bookmark_id"] for b in bookmarks)
+        return {
+            "user": account.user,
+            "bookmarks": bookmarks,
+            "highlights": [
+                h for h in account.highlights.values() if h["bookmark_id"] in shown
+            ],
+            "delete_ids": sorted(have - ids),
+        }
+
+    def _mutate(self, account, op, params):
+        bookmark = account.bookmark(params.get("bookmark_id"))
+        if op == "star":
+            bookmark["starred"] = "1"
+        elif op == "unstar":
+            bookmark["starred"] = "0"
+        elif op == "archive":
+            bookmark["folder"] = "archive"
+        elif op == "unarchive":
+            bookmark["folder"] = "unread"
+        elif op == "move":
+            bookmark["folder"] = account.folder(params.get("folder_id"))
+        elif op == "delete":
+            del account.bookmarks[bookmark["bookmark_id"]]
+            return []
+        elif op == "update_read_progress":
+            bookmark["progress"] = float(params.get("progress") or 0)
+            bookmark["progress_timestamp"] = int(params.get("progress_timestamp") or 0)
+        else:
+            raise MockError(404, "Unknown endpoint bookmarks/" + op, 404)
+        return [_public(bookmark)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--bookmarks", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockInstapaper(
+        bookmarks=args.bookmarks,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        host=args.host,
+        port=args.port,
+    )
+    print(
+        "serving the Instapaper API on {} (key/secret, user/pass)".format(server.base)
+    )
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,8 @@ setup(
     author="Ryan Galloway",
     author_email="ryan@rsgalloway.com",
     url="http://github.com/rsgalloway/instapaper",
-    py_modules=["instapaper"],
+    py_modules=["instapaper", "instapaper_async"],
     install_requires=requirements,
+    extras_require={"lxml": ["lxml"], "orjson": ["orjson"]},
+    entry_points={"console_scripts": ["instapaper=instapaper:main"]},
 )
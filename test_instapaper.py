@@ -44,7 +44,13 @@ machine api.instapaper.com
   password <app_secret>
 
 """
+
 import netrc
+import os
+import subprocess
+import sys
+from multiprocessing.pool import ThreadPool
+
 import instapaper
 
 
@@ -78,3 +84,924 @@ def test_bookmarks():
     instapaper_engine.login(*credentials_from_netrc())
     bookmarks = instapaper_engine.bookmarks()
     assert bookmarks is not None
+
+
+def test_sync_snapshot():
+    snapshot = instapaper.SyncSnapshot()
+    bookmark = instapaper.Bookmark(
+        None,
+        {"bookmark_id": 1, "hash": "abc", "progress": 0.5, "progress_timestamp": 10},
+    )
+    added, changed, deleted = snapshot.apply("unread", [bookmark], [])
+    assert added == [bookmark] and not changed and not deleted
+    assert snapshot.have("unread") == "1:abc:0.5:10"
+    bookmark.hash = "def"
+    added, changed, deleted = snapshot.apply("unread", [bookmark], [1])
+    assert changed == [bookmark] and deleted == [1]
+    assert snapshot.have("unread") == ""
+
+
+def test_bookmark_store():
+    store = instapaper.BookmarkStore()
+    store.put_bookmarks(
+        [
+            instapaper.Bookmark(None, {"bookmark_id": 1, "time": 10, "starred": "1"}),
+            instapaper.Bookmark(None, {"bookmark_id": 2, "time": 20, "starred": "0"}),
+        ],
+        "unread",
+    )
+    assert [b.bookmark_id for b in store.query(folder="unread")] == [2, 1]
+    assert [b.bookmark_id for b in store.query(starred=True)] == [1]
+    assert [b.bookmark_id for b in store.query(since=15)] == [2]
+    store.delete([2])
+    assert store.get(2) is None
+
+
+def test_batch_coalescing():
+    batch = instapaper.Batch(None)
+    first = instapaper.Bookmark(None, {"bookmark_id": 1})
+    second = instapaper.Bookmark(None, {"bookmark_id": 2})
+    batch.add(first, "star")
+    batch.add(first, "unstar")
+    batch.add(first, "move", 10)
+    batch.add(first, "move", 20)
+    batch.add(second, "archive")
+    batch.add(second, "delete")
+    batch.add(second, "star")
+    assert len(batch) == 2
+
+
+def test_batch_flush():
+    import socket
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=5) as server:
+        account = server.account("user")
+        client = instapaper.Instapaper("key", "secret", base=server.base)
+        client.login("user", "pass")
+        client.create_folder("Later")
+        folder_id = client.folders()[0]["folder_id"]
+        marks = client.bookmarks(limit=5)
+        http = client.http
+
+        class Unreachable(object):
+            # fails every request for the last bookmark
+            def request(self, uri, method="GET", body=None, headers=None):
+                if "bookmark_id={}".format(marks[4].bookmark_id) in (body or ""):
+                    raise socket.error("unreachable")
+                return http.request(uri, method, body, headers)
+
+        client.http = Unreachable()
+        with client.batch() as batch:
+            marks[0].star()
+            marks[0].unstar()
+            marks[0].move(folder_id)
+            marks[1].archive()
+            marks[1].delete()
+            marks[2].star()
+            marks[3].move(999)
+            marks[4].archive()
+        assert server.requests.get("bookmarks/unstar") is None
+        assert server.requests.get("bookmarks/archive") is None
+        assert server.requests["bookmarks/star"] == 1
+        assert server.requests["bookmarks/move"] == 2
+        assert server.requests["bookmarks/delete"] == 1
+        results = dict(((r.bookmark.bookmark_id, r.op), r) for r in batch.results)
+        assert len(results) == 5
+        assert results[(marks[0].bookmark_id, "move")].args == (folder_id,)
+        assert results[(marks[1].bookmark_id, "delete")].result is True
+        assert results[(marks[2].bookmark_id, "star")].result is True
+        assert results[(marks[3].bookmark_id, "move")].result is False
+        failed = results[(marks[4].bookmark_id, "archive")]
+        assert failed.result is False and isinstance(failed.error, socket.error)
+        assert account.bookmarks[marks[0].bookmark_id]["folder"] == folder_id
+        assert marks[1].bookmark_id not in account.bookmarks
+        assert account.bookmarks[marks[4].bookmark_id]["folder"] == "unread"
+
+
+def test_connection_pool():
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    clients = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            clients.add(self.client_address)
+            self.rfile.read(int(self.headers["Content-Length"]))
+            signed = "oauth_signature=" in self.headers["Authorization"]
+            content = b"signed" if signed else b"unsigned"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever).start()
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    transport = instapaper.HTTPTransport(
+        instapaper.OAuthSigner("key", "secret", "token", "token_secret"),
+        instapaper.ConnectionPool(base, size=2),
+    )
+    pool = ThreadPool(8)
+    results = pool.map(
+        lambda i: transport.request(base + "/api", "POST", "bookmark_id={}".format(i)),
+        range(32),
+    )
+    pool.terminate()
+    server.shutdown()
+    assert all(r[0].status == 200 and r[1] == b"signed" for r in results)
+    assert len(clients) <= 2
+
+
+def test_connection_pool_retry():
+    import socket
+    import threading
+    import time
+    import pytest
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hits = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            hits[self.path] = hits.get(self.path, 0) + 1
+            if self.path == "/slow":
+                time.sleep(0.5)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+            # drop the connection without telling the client
+            self.close_connection = self.path == "/close"
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pool = instapaper.ConnectionPool(
+        "http://127.0.0.1:{}".format(server.server_address[1]), size=1, timeout=0.2
+    )
+    try:
+        assert pool.request("POST", "/close", b"")[1] == b"ok"
+        time.sleep(0.05)
+        # the idle connection is gone, the request is sent again on a new one
+        assert pool.request("POST", "/ok", b"")[1] == b"ok"
+        assert hits["/ok"] == 1
+        # a timeout may have reached the server, so it is never retried
+        with pytest.raises(socket.timeout):
+            pool.request("POST", "/slow", b"")
+        time.sleep(0.6)
+        assert hits["/slow"] == 1
+        assert pool.request("POST", "/ok", b"")[1] == b"ok"
+    finally:
+        pool.close()
+        server.shutdown()
+
+
+def test_rate_limiter():
+    limiter = instapaper.RateLimiter({"highlights": (100, 1)}, backoff=0.01)
+    base = "https://www.instapaper.com/api/1.1/"
+    assert limiter.group(base + "bookmarks/1/highlights") == "highlights"
+    assert limiter.group(base + "folders/list") == "folders"
+    for _ in range(3):
+        limiter.acquire("highlights")
+    assert limiter.throttled("highlights", 0) <= 0.01
+    assert limiter.buckets["highlights"].rate == 50
+    stats = limiter.stats()["highlights"]
+    assert stats["requests"] == 3 and stats["throttled"] == 1
+    assert stats["wait_time"] > 0 and stats["queue_depth"] == 0
+
+
+def test_iter_records():
+    text = '{"user": {"a": [1]}, "bookmarks": [{"bookmark_id": 1}, {"bookmark_id": 2}], "delete_ids": ""}'
+    records = instapaper._iter_records(text, "bookmarks")
+    assert next(records) == {"bookmark_id": 1}
+    assert [r["bookmark_id"] for r in records] == [2]
+    assert list(instapaper._iter_records('{"bookmarks": []}', "bookmarks")) == []
+
+
+def test_iter_bookmarks():
+    import json
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=12) as server:
+        store = instapaper.BookmarkStore()
+        client = instapaper.Instapaper("key", "secret", base=server.base, store=store)
+        client.login("user", "pass")
+        marks = list(client.iter_bookmarks(page_size=5))
+        assert len(set(m.bookmark_id for m in marks)) == 12
+        assert server.requests["bookmarks/list"] == 3
+        assert len(store.query(folder="unread", limit=50)) == 12
+
+    class IgnoresHave(object):
+        requests = 0
+
+        def request(self, uri, method="GET", body=None, headers=None):
+            self.requests += 1
+            page = {"bookmarks": [{"bookmark_id": 1}, {"bookmark_id": 2}]}
+            return {"status": "200"}, json.dumps(page).encode("utf-8")
+
+    client.http = IgnoresHave()
+    assert [m.bookmark_id for m in client.iter_bookmarks(page_size=2)] == [1, 2]
+    assert client.http.requests == 2
+
+
+def test_bookmark_fields():
+    bookmark = instapaper.Bookmark(
+        None, {"bookmark_id": 1, "starred": "1", "time": "10", "custom": "x"}
+    )
+    assert not hasattr(bookmark, "__dict__")
+    assert bookmark.starred is True and bookmark.time == 10
+    assert bookmark.custom == "x"
+    assert bookmark.to_dict()["custom"] == "x"
+    try:
+        bookmark.title
+        assert False
+    except AttributeError:
+        pass
+
+
+def test_bookmark_set():
+    bookmarks = instapaper.BookmarkSet(
+        None, [{"bookmark_id": 1, "title": "a"}, {"bookmark_id": 2, "url": "b"}]
+    )
+    assert len(bookmarks) == 2
+    assert bookmarks[0].title == "a" and bookmarks[-1].url == "b"
+    assert bookmarks.column("title") == ["a", None]
+    assert [b.bookmark_id for b in bookmarks[1:]] == [2]
+
+
+def test_dehtml():
+    import glob
+    import os
+
+    html = "<p>one  two</p>three<br>four<br/>five &amp; <b>six</b><script>a<b</script>"
+    assert instapaper.dehtml(html) == "one two three \nfour \n\nfive & six a<b"
+    assert instapaper.dehtml("") is None
+    for html in ("<style>a", "x<script>a<b", "<style>a</style>b<script type=x>c"):
+        assert instapaper._dehtml_regex(html) == instapaper._dehtml_htmlparser(html)
+    assert instapaper._dehtml_regex("<style>a") == ""
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "articles")
+    for path in glob.glob(os.path.join(fixtures, "*.html")):
+        with open(path) as f:
+            html = f.read()
+        assert instapaper._dehtml_regex(html) == instapaper._dehtml_htmlparser(html)
+
+
+def test_article_cache(tmpdir):
+    cache = instapaper.ArticleCache(str(tmpdir), max_bytes=1024)
+    cache.put(1, "abc", "<p>hello</p>")
+    cache.put(1, "abc", "hello", "text")
+    assert cache.get(1, "abc") == "<p>hello</p>"
+    assert cache.get(1, "abc", "text") == "hello"
+    cache.put(1, "def", "<p>changed</p>")
+    assert cache.get(1, "abc") is None and cache.get(1, "abc", "text") is None
+    assert instapaper.ArticleCache(str(tmpdir)).get(1, "def") == "<p>changed</p>"
+    for i in range(100):
+        cache.put(i + 2, "x", "article {}".format(i) * 10)
+    assert cache.size <= 1024 and cache.get(1, "def") is None
+
+
+def test_dehtml_many():
+    docs = ["<p>{}</p>".format(i) for i in range(50)]
+    assert list(instapaper.dehtml_many(docs, processes=2, chunksize=4)) == [
+        str(i) for i in range(50)
+    ]
+    unordered = dict(instapaper.dehtml_many(docs, processes=2, ordered=False))
+    assert unordered[7] == "7" and len(unordered) == 50
+
+
+def test_export(tmpdir):
+    import json
+
+    client = instapaper.Instapaper("key", "secret")
+    folders = {"unread": [1, 2, 3, 4, 5], "archive": [6, 7, 8]}
+    interrupt = [True]
+
+    def iter_bookmarks(folder, page_size=500, have=()):
+        have = set(str(i) for i in have)
+        for i in folders[folder]:
+            if str(i) in have:
+                continue
+            if interrupt[0] and i == 4:
+                raise IOError("connection reset")
+            yield instapaper.Bookmark(client, {"bookmark_id": i, "title": str(i)})
+
+    client.iter_bookmarks = iter_bookmarks
+    path = str(tmpdir.join("export.jsonl"))
+    kwargs = dict(folders=["unread", "archive"], checkpoint_every=2)
+    try:
+        client.export(path, **kwargs)
+        assert False
+    except IOError:
+        pass
+    interrupt[0] = False
+    assert client.export(path, **kwargs) == 8
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [r["bookmark_id"] for r in records] == list(range(1, 9))
+    assert records[-1]["folder"] == "archive"
+    assert not tmpdir.join("export.jsonl.checkpoint").exists()
+
+    path = str(tmpdir.join("export.col"))
+    assert client.export(path, format="columnar", **kwargs) == 8
+    records = list(instapaper.read_columnar(path))
+    assert [r["title"] for r in records] == [str(i) for i in range(1, 9)]
+
+
+def test_imap_bounded():
+    consumed = []
+
+    def source():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    results = instapaper._imap_bounded(lambda i: i * 2, source(), 4)
+    first = next(results)
+    assert len(consumed) <= 9 and first % 2 == 0
+    assert sorted([first] + list(results)) == [i * 2 for i in range(100)]
+
+
+def test_import(tmpdir):
+    import json
+    import threading
+
+    assert (
+        instapaper.normalize_url("HTTPS://Example.com:443?utm_source=x&id=1#top")
+        == "https://example.com/?id=1"
+    )
+    tmpdir.join("links.csv").write(
+        "URL,Title,Selection,Folder\nhttp://a.com/1,One,,Unread\n"
+    )
+    tmpdir.join("links.txt").write("http://a.com/1\nhttp://a.com/2\n")
+    tmpdir.join("links.html").write(
+        "<DL><p><DT><H3>News</H3><DL><p><DT><A HREF='http://a.com/3'>Three</A>"
+        "<DD>third link</DL><DT><A HREF='http://a.com/4'>Four</A></DL>"
+    )
+    records = list(instapaper.read_import(str(tmpdir.join("links.csv"))))
+    assert records == [{"url": "http://a.com/1", "title": "One", "folder": "Unread"}]
+    records = list(instapaper.read_import(str(tmpdir.join("links.txt"))))
+    assert [r["url"] for r in records] == ["http://a.com/1", "http://a.com/2"]
+    records = list(instapaper.read_import(str(tmpdir.join("links.html"))))
+    assert records[0]["folder"] == "News" and records[1]["folder"] is None
+    assert records[0]["description"] == "third link"
+
+    class FakeHTTP(object):
+        def __init__(self):
+            self.added = []
+            self.lock = threading.Lock()
+
+        def request(self, uri, method="GET", body=None, headers=None):
+            params = dict(instapaper.urlparse.parse_qsl(body))
+            with self.lock:
+                self.added.append(params)
+                bookmark_id = len(self.added)
+            if params["url"].endswith("/bad"):
+                error = [{"type": "error", "error_code": 1240, "message": "Bad url"}]
+                return instapaper._Response(400, {}), json.dumps(error).encode()
+            data = [{"type": "bookmark", "bookmark_id": bookmark_id}]
+            return instapaper._Response(200, {}), json.dumps(data).encode()
+
+    client = instapaper.Instapaper("key", "secret")
+    client.http = FakeHTTP()
+    records = [
+        "a.com/1",
+        "http://a.com/1#x",
+        {"url": "http://a.com/2", "bookmark_id": 999, "folder": 42},
+        "http://old.com/",
+        "a.com/bad",
+    ]
+    results = list(client.import_bookmarks(records, existing=["http://old.com"]))
+    statuses = sorted((r.url, r.status, r.error) for r in results)
+    assert statuses == [
+        ("a.com/1", "added", None),
+        ("a.com/bad", "failed", "Bad url"),
+        ("http://a.com/1#x", "duplicate", None),
+        ("http://a.com/2", "added", None),
+        ("http://old.com/", "duplicate", None),
+    ]
+    sent = dict((p["url"], p) for p in client.http.added)
+    assert sorted(sent) == ["a.com/1", "a.com/bad", "http://a.com/2"]
+    assert sent["http://a.com/2"]["folder_id"] == "42"
+    assert "bookmark_id" not in sent["http://a.com/2"]
+    added = [r.bookmark_id for r in results if r.status == "added"]
+    assert sorted(added) == sorted(
+        i + 1 for i, p in enumerate(client.http.added) if not p["url"].endswith("bad")
+    )
+    assert 999 not in added
+
+
+def test_highlights():
+    import json
+
+    class FakeHTTP(object):
+        def __init__(self):
+            self.requests = []
+
+        def request(self, uri, method="GET", body=None, headers=None):
+            self.requests.append(uri)
+            parts = uri.split("/")
+            if parts[-1] == "highlights":
+                bookmark_id = int(parts[-2])
+                data = [
+                    {
+                        "type": "highlight",
+                        "highlight_id": bookmark_id * 10,
+                        "bookmark_id": bookmark_id,
+                        "text": "Passage  {}".format(bookmark_id),
+                    }
+                ]
+                return instapaper._Response(200, {}), json.dumps(data).encode()
+            return instapaper._Response(200, {}), b"[]"
+
+    client = instapaper.Instapaper("key", "secret")
+    client.http = FakeHTTP()
+    bookmarks = [instapaper.Bookmark(client, {"bookmark_id": i}) for i in range(1, 21)]
+    results = dict(client.highlights_for(bookmarks, workers=4))
+    assert len(results) == 20 and len(client.http.requests) == 20
+    assert results[bookmarks[2]][0].text == "Passage  3"
+    list(client.highlights_for(bookmarks))
+    assert len(client.http.requests) == 20
+    assert [h.bookmark_id for h in client.highlight_cache.find("passage 3")] == [3]
+    assert len(client.highlight_cache.search("passage 1")) == 11
+    bookmarks[2].create_highlight("more")
+    assert client.highlight_cache.get(3) is None
+    results[bookmarks[4]][0].delete()
+    assert client.highlight_cache.get(5) is None
+    assert client.highlight_cache.find("passage 5") == []
+    assert bookmarks[3].highlights()[0].highlight_id == 40
+
+
+def test_metrics():
+    class FakePool(object):
+        statuses = [429, 200, 200]
+
+        def request(self, method, path, body, headers):
+            return instapaper._Response(self.statuses.pop(0), {}), b"[]"
+
+    events = []
+    metrics = instapaper.Metrics(buckets=(1.0,), trace=events.append)
+    transport = instapaper.HTTPTransport(
+        instapaper.OAuthSigner("key", "secret"),
+        FakePool(),
+        instapaper.RateLimiter(backoff=0.001),
+        metrics,
+    )
+    base = "https://www.instapaper.com/api/1.1/"
+    transport.request(base + "bookmarks/list", "POST", "limit=1")
+    transport.request(base + "bookmarks/123/highlights", "POST")
+    stats = metrics.stats()
+    assert stats["bookmarks/list"]["statuses"] == {429: 1, 200: 1}
+    assert stats["bookmarks/list"]["retries"] == 1
+    assert stats["bookmarks/list"]["bytes_sent"] == 14
+    assert stats["bookmarks/:id/highlights"]["requests"] == 1
+    assert [e.attempt for e in events] == [0, 1, 0]
+    text = metrics.prometheus()
+    assert 'instapaper_requests_total{endpoint="bookmarks/list",status="429"} 1' in text
+    assert (
+        'instapaper_request_duration_seconds_bucket{endpoint="bookmarks/list",le="+Inf"} 2'
+        in text
+    )
+
+
+def test_mock_server():
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=30, error_rate=0.2) as server:
+        client = instapaper.Instapaper(
+            "key", "secret", base=server.base, limiter=instapaper.RateLimiter(backoff=0)
+        )
+        try:
+            client.login("user", "wrong")
+            assert False
+        except instapaper.InstapaperAuthenticationException:
+            pass
+        server.error_rate = 0
+        client.login("user", "pass")
+        server.error_rate = 0.2
+        assert client.user()["username"] == "user"
+        marks = list(client.iter_bookmarks(page_size=7))
+        assert len(marks) == 30
+        assert marks[0].star() and marks[0].text.startswith("On Reading Later")
+        assert [m.bookmark_id for m in client.bookmarks("starred", 5)] == [
+            marks[0].bookmark_id
+        ]
+        assert client.metrics.stats()["bookmarks/list"]["statuses"].get(200) >= 5
+
+
+def test_json_backends():
+    data = b'{"bookmarks": [{"bookmark_id": 1, "starred": "1"}], "delete_ids": [3]}'
+    try:
+        for backend in (
+            ("json", "orjson") if instapaper._orjson_available() else ("json",)
+        ):
+            instapaper.set_json_backend(backend)
+            assert instapaper._loads(data)["delete_ids"] == [3]
+            records = list(instapaper._records(data, "bookmarks"))
+            assert records == [{"bookmark_id": 1, "starred": "1"}]
+            assert list(instapaper._records(b'[{"type": "meta"}]', "bookmarks")) == []
+            try:
+                list(
+                    instapaper._records(
+                        b'[{"type": "error", "message": "x"}]', "bookmarks"
+                    )
+                )
+                assert False
+            except Exception as e:
+                assert str(e) == "x"
+        try:
+            instapaper.set_json_backend("yaml")
+            assert False
+        except instapaper.InstapaperException:
+            pass
+    finally:
+        instapaper.set_json_backend("auto")
+
+
+def test_fair_scheduler():
+    import threading
+    import time
+
+    scheduler = instapaper.FairScheduler(1)
+    scheduler.acquire("main")
+    order = []
+
+    def request(user):
+        scheduler.acquire(user)
+        order.append(user)
+        scheduler.release()
+
+    threads = []
+    for user in ["a"] * 4 + ["b"] * 2:
+        threads.append(threading.Thread(target=request, args=(user,)))
+        threads[-1].start()
+        while scheduler.waiting() < len(threads):
+            time.sleep(0.001)
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["a", "b", "a", "b", "a", "a"]
+
+
+def test_instapaper_pool():
+    from mock_instapaper import MockInstapaper
+
+    users = {"alice": "a", "bob": "b", "carol": "c"}
+    with MockInstapaper(users=users, bookmarks=5) as server:
+        pool = instapaper.InstapaperPool(
+            "key", "secret", pool_size=2, max_sessions=2, base=server.base
+        )
+        for username, password in users.items():
+            pool.login(username, username, password)
+        assert len(pool) == 3 and pool.sessions() == ["bob", "carol"]
+        assert pool["alice"].user()["username"] == "alice"
+        assert pool.sessions() == ["carol", "alice"]
+        assert all(c.pool is pool.connections for c in map(pool.get, users))
+        results = ThreadPool(6).map(
+            lambda key: len(pool[key].bookmarks(limit=5)), list(users) * 4
+        )
+        assert results == [5] * 12
+        pool.idle_timeout = 0.01
+        instapaper.time.sleep(0.02)
+        assert pool.evict_idle(force=True) == 2 and pool.sessions() == []
+        assert pool["bob"].user()["username"] == "bob"
+        pool.close()
+
+
+def test_credential_cache(tmpdir):
+    import os
+    import stat
+    from mock_instapaper import MockInstapaper
+
+    cache = instapaper.CredentialCache(str(tmpdir.join("auth", "tokens.json")))
+    with MockInstapaper(bookmarks=1) as server:
+
+        def client():
+            return instapaper.Instapaper(
+                "key", "secret", base=server.base, credentials=cache
+            )
+
+        client().login("user", "pass")
+        mode = os.stat(cache.path).st_mode
+        assert stat.S_IMODE(mode) == 0o600
+        token = cache.get("key", "user")
+        assert token is not None
+        second = client()
+        second.login("user", "pass")
+        assert server.requests["oauth/access_token"] == 1
+        server.revoke("user")
+        assert second.user()["username"] == "user"
+        assert server.requests["oauth/access_token"] == 2
+        assert cache.get("key", "user") not in (None, token)
+        try:
+            client().login("user", "wrong", cached=False)
+            assert False
+        except instapaper.InstapaperAuthenticationException:
+            pass
+
+
+def test_search_index():
+    from mock_instapaper import MockInstapaper
+
+    index = instapaper.SearchIndex()
+    index.update(1, "Reading later", "about queues", "The quick brown fox jumps")
+    index.update(2, "Brown bears", "", "A fox and a bear went reading")
+    index.update(1, text="The quick brown fox jumped over the lazy dog")
+    index.update(1)
+    index.update(3)
+    assert len(index) == 2
+    assert [r.bookmark_id for r in index.query("brown")] == [2, 1]
+    assert [r.bookmark_id for r in index.query('"lazy dog" fox')] == [1]
+    assert [r.bookmark_id for r in index.query("jump")] == [1]
+    assert [r.bookmark_id for r in index.query("rea*")] == [1, 2]
+    assert index.query('" " *') == [] and index.query("") == []
+    assert "[lazy]" in index.query("lazy")[0].snippet
+    index.delete([1])
+    assert len(index) == 1
+
+    with MockInstapaper(bookmarks=20) as server:
+        client = instapaper.Instapaper(
+            "key", "secret", base=server.base, search=instapaper.SearchIndex()
+        )
+        client.login("user", "pass")
+        marks = list(client.iter_bookmarks())
+        assert len(client.search) == 20
+        assert client.search_bookmarks("article 7")[0].bookmark_id == next(
+            m.bookmark_id for m in marks if m.title == "Article 7"
+        )
+        marks[0].text
+        assert client.search_bookmarks('"reading later"')[0].bookmark_id == (
+            marks[0].bookmark_id
+        )
+        snapshot = instapaper.SyncSnapshot()
+        client.sync(snapshot, folders=("unread", "archive"))
+        marks[1].archive()
+        marks[2].delete()
+        client.sync(snapshot, folders=("unread", "archive"))
+        ids = set(r.bookmark_id for r in client.search_bookmarks("article", 50))
+        assert marks[1].bookmark_id in ids and marks[2].bookmark_id not in ids
+        assert len(ids) == 19
+
+
+def test_lazy_import():
+    code = (
+        "import sys, instapaper; "
+        "print(sorted(set(sys.modules) & {'oauth2', 'json', 'sqlite3'}))"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    assert output.strip() == b"[]"
+    client = instapaper.Instapaper("key", "secret")
+    assert client.consumer is client.consumer
+    assert client.urls[instapaper._BOOKMARKS_LIST_] == (
+        "https://www.instapaper.com/api/1.1/bookmarks/list"
+    )
+
+
+def test_folder_bulk_ops():
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=30) as server:
+        account = server.account("user")
+        client = instapaper.Instapaper("key", "secret", base=server.base)
+        client.login("user", "pass")
+        client.create_folder("Old")
+        client.create_folder("Stale")
+        old, stale = [f["folder_id"] for f in client.folders()]
+        marks = client.bookmarks(limit=30)
+        ids = [mark.bookmark_id for mark in marks]
+        for mark in marks[:10]:
+            mark.move(old)
+        marks[10].move(stale)
+
+        seen = []
+        results = client.archive_folder(old, progress=lambda n, r: seen.append(n))
+        assert len(results) == 10 and all(r.result for r in results)
+        assert sorted(seen) == list(range(1, 11))
+        assert all(account.bookmarks[i]["folder"] == "archive" for i in ids[:10])
+
+        server.fail("bookmarks/move", 400, count=2)
+        results = client.move_all(
+            "unread", old, predicate=lambda b: b.bookmark_id in ids[11:21]
+        )
+        assert len(results) == 10
+        assert sum(1 for r in results if not r.result) == 2
+        assert sum(1 for i in ids[11:21] if account.bookmarks[i]["folder"] == old) == 8
+
+        spec = {"Old": ids[11:16], "Fresh": ids[21:23]}
+        plan = client.folder_plan(spec)
+        assert plan.create == ["Fresh"] and plan.delete == [stale]
+        moved = sorted(b.bookmark_id for b, title in plan.move if title == "Old")
+        assert moved == sorted(
+            i for i in ids[11:16] if account.bookmarks[i]["folder"] != old
+        )
+        results = client.mirror_folders(spec)
+        assert all(r.result for r in results)
+        assert [r.op for r in results if r.bookmark is None] == [
+            "create_folder",
+            "delete_folder",
+        ]
+        titles = dict((f["folder_id"], f["title"]) for f in client.folders())
+        assert sorted(titles.values()) == ["Fresh", "Old"]
+        assert all(account.bookmarks[i]["folder"] == old for i in ids[11:16])
+        assert all(
+            titles[account.bookmarks[i]["folder"]] == "Fresh" for i in ids[21:23]
+        )
+        assert account.bookmarks[ids[10]]["folder"] == "archive"
+        assert client.folder_plan(spec) == ([], [], [])
+
+
+def test_progress_buffer(tmpdir):
+    from mock_instapaper import MockInstapaper
+
+    journal = str(tmpdir.join("progress.jsonl"))
+    with MockInstapaper(bookmarks=10) as server:
+        account = server.account("user")
+        buffer = instapaper.ProgressBuffer(journal, interval=0, max_pending=3)
+        client = instapaper.Instapaper(
+            "key", "secret", base=server.base, progress_buffer=buffer
+        )
+        client.login("user", "pass")
+        marks = client.bookmarks(limit=10)
+        for i, progress in enumerate((0.1, 0.2, 0.3)):
+            assert marks[0].update_progress(progress, 1000 + i) is None
+        marks[1].update_progress(0.5, 1000)
+        assert len(buffer) == 2
+        assert server.requests.get("bookmarks/update_read_progress") is None
+
+        # newer progress on the server wins over the pending update
+        account.bookmarks[marks[1].bookmark_id]["progress_timestamp"] = 2000
+        client.bookmarks(limit=10)
+        assert list(buffer.pending()) == [marks[0].bookmark_id]
+
+        # a crash before flushing keeps the update in the journal
+        recovered = instapaper.ProgressBuffer(journal, interval=0)
+        assert recovered.pending() == {marks[0].bookmark_id: (0.3, 1002)}
+        client.progress_buffer = recovered
+        recovered.parent = client
+
+        server.fail("bookmarks/update_read_progress", 400)
+        for mark in marks[2:4]:
+            mark.update_progress(0.9, 1500)
+        results = recovered.flush()
+        assert len(results) == 3 and sum(1 for r in results if not r.result) == 1
+        assert len(recovered) == 1
+        recovered.close()
+        assert len(recovered) == 0 and not tmpdir.join("progress.jsonl").exists()
+        for mark in [marks[0]] + marks[2:4]:
+            record = account.bookmarks[mark.bookmark_id]
+            assert record["progress_timestamp"] in (1002, 1500)
+        assert account.bookmarks[marks[1].bookmark_id]["progress"] == 0.0
+
+        # max_pending triggers a flush from update_progress itself
+        buffer = instapaper.ProgressBuffer(interval=0, max_pending=3)
+        client.progress_buffer, buffer.parent = buffer, client
+        for mark in marks[4:7]:
+            mark.update_progress(0.4, 1600)
+        assert len(buffer) == 0
+        assert all(
+            account.bookmarks[m.bookmark_id]["progress"] == 0.4 for m in marks[4:7]
+        )
+        assert marks[4].progress_timestamp == 1600
+        assert marks[4].update_progress(0.1, 10) is False
+
+        client.progress_buffer = None
+        assert marks[7].update_progress(0.7) is True
+        assert account.bookmarks[marks[7].bookmark_id]["progress"] == 0.7
+
+
+def test_single_flight():
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=5, latency=0.2) as server:
+        client = instapaper.Instapaper(
+            "key", "secret", base=server.base, pool_size=8, memo_ttl=60
+        )
+        client.login("user", "pass")
+        record = client.bookmarks(limit=1)[0].to_dict()
+        copies = [instapaper.Bookmark(client, record) for _ in range(8)]
+        pool = ThreadPool(8)
+        try:
+            htmls = pool.map(lambda mark: mark.html, copies)
+            folders = pool.map(lambda i: client.folders(), range(8))
+        finally:
+            pool.terminate()
+        assert len(set(htmls)) == 1 and htmls[0]
+        assert server.requests["bookmarks/get_text"] == 1
+        assert folders == [[]] * 8
+        assert server.requests["folders/list"] == 1
+        assert len(client.http.inflight) == 0
+
+        client.user()
+        client.user()
+        assert server.requests["account/verify_credentials"] == 1
+        client.folders()
+        assert server.requests["folders/list"] == 1
+        client.create_folder("Later")
+        assert [f["title"] for f in client.folders()] == ["Later"]
+        assert server.requests["folders/list"] == 2
+
+        # writes are never merged
+        pool = ThreadPool(4)
+        try:
+            pool.map(lambda mark: mark.star(), copies[:4])
+        finally:
+            pool.terminate()
+        assert server.requests["bookmarks/star"] == 4
+
+
+def test_fetch_texts():
+    import time
+    from mock_instapaper import MockInstapaper
+
+    with MockInstapaper(bookmarks=16, latency=0.1) as server:
+        client = instapaper.Instapaper("key", "secret", base=server.base)
+        client.login("user", "pass")
+        marks = client.bookmarks(limit=16)
+        start = time.time()
+        texts = client.fetch_texts(marks, workers=8)
+        first = next(texts)
+        streamed = time.time() - start
+        done = [first] + list(texts)
+        elapsed = time.time() - start
+        assert sorted(m.bookmark_id for m in done) == sorted(
+            m.bookmark_id for m in marks
+        )
+        assert all(m.text for m in done)
+        # 16 requests of 100ms each over 8 workers, not one after another
+        assert streamed < elapsed and elapsed < 1.2
+        assert server.requests["bookmarks/get_text"] == 16
+        list(client.fetch_texts(marks, workers=8))
+        assert server.requests["bookmarks/get_text"] == 16
+
+
+def test_async_timeout():
+    import asyncio
+    import socket
+    import pytest
+    from mock_instapaper import MockInstapaper
+    from instapaper_async import AsyncBookmark, AsyncInstapaper
+
+    async def run(base):
+        client = AsyncInstapaper("key", "secret", base=base, timeout=0.2)
+        await client.login("user", "pass")
+        marks = await client.bookmarks(limit=2)
+        assert await marks[0].star() and await marks[0].text
+        with pytest.raises(instapaper.InstapaperException):
+            marks[0]._fetch_html(None)
+        client.close()
+
+    with MockInstapaper(bookmarks=2) as server:
+        asyncio.run(run(server.base))
+
+    # a server that accepts but never answers
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    base = "http://127.0.0.1:{}".format(listener.getsockname()[1])
+
+    async def hang():
+        client = AsyncInstapaper("key", "secret", base=base, timeout=0.2)
+        with pytest.raises(asyncio.TimeoutError):
+            await client.user()
+        assert client.pool._idle == []
+
+    try:
+        asyncio.run(hang())
+    finally:
+        listener.close()
+
+
+def test_async_highlights():
+    import asyncio
+    from mock_instapaper import MockInstapaper
+    from instapaper_async import AsyncInstapaper
+
+    async def run(base):
+        client = AsyncInstapaper("key", "secret", base=base)
+        await client.login("user", "pass")
+        mark = (await client.bookmarks(limit=1))[0]
+        assert await mark.highlights() == []
+        await mark.create_highlight("a passage", 3)
+        highlights = await mark.highlights()
+        assert [h.text for h in highlights] == ["a passage"]
+        assert len(await mark.highlights()) == 1
+        assert await highlights[0].delete()
+        assert await mark.highlights() == []
+        client.close()
+
+    with MockInstapaper(bookmarks=1) as server:
+        asyncio.run(run(server.base))
+        assert server.requests["bookmarks/:id/highlights"] == 3
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------------------------------
+# Copyright (c) 2013-2025, Ryan Galloway (ryan@rsgalloway.com)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# - Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# - Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# - Neither the name of the software nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# ---------------------------------------------------------------------------------------------
+# docs and latest version available for download at
+# http://github.com/rsgalloway/instapaper
+# ---------
+
+import asyncio
+import json
+from urllib.parse import parse_qsl
+
+import instapaper_async
+
+
+async def _serve(reader, writer, requests):
+    """
+    Minimal keep-alive stand-in for the Instapaper API.
+    """
+    while True:
+        try:
+            line = await reader.readuntil(b"\r\n")
+        except asyncio.IncompleteReadError:
+            break
+        path = line.split()[1].decode()
+        headers = {}
+        while True:
+            header = (await reader.readuntil(b"\r\n")).decode().strip()
+            if not header:
+                break
+            key, _, value = header.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers["content-length"]))
+        params = dict(parse_qsl(body.decode()))
+        requests.append((path, params, headers))
+        if path.endswith("oauth/access_token"):
+            content = b"oauth_token=tok&oauth_token_secret=sec"
+        elif path.endswith("bookmarks/list"):
+            content = json.dumps(
+                {"bookmarks": [{"bookmark_id": 1, "title": "t", "starred": "0"}]}
+            ).encode()
+        elif path.endswith("bookmarks/get_text"):
+            content = b"<p>hello</p><p>world</p>"
+        else:
+            content = b"[]"
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(content) + content
+        )
+        await writer.drain()
+    writer.close()
+
+
+def test_async_client():
+    async def run():
+        requests = []
+        connections = []
+
+        async def handler(reader, writer):
+            connections.append(writer)
+            await _serve(reader, writer, requests)
+
+        server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = instapaper_async.AsyncInstapaper(
+            "key", "secret", base="http://127.0.0.1:{}".format(port), pool_size=4
+        )
+        await client.login("user", "password")
+        marks = await client.bookmarks()
+        results = await asyncio.gather(*[marks[0].star() for _ in range(20)])
+        text = await marks[0].text
+        client.close()
+        server.close()
+        await asyncio.sleep(0.01)
+        return requests, connections, marks, results, text
+
+    requests, connections, marks, results, text = asyncio.run(run())
+    assert all(results) and marks[0].starred
+    assert text == "hello \n\nworld"
+    assert len(connections) <= 4
+    assert all('oauth_token="tok"' in r[2]["authorization"] for r in requests[1:])